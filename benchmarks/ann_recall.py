@@ -0,0 +1,84 @@
+"""Recall@k vs. QPS of the LOCAL_IVF backend against exact LOCAL search.
+
+    python -m benchmarks.ann_recall --num-vectors 200000 --nprobe 1,4,16,64
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+
+def synthetic_vectors(
+    num_vectors: int, dimension: int, num_topics: int = 256, seed: int = 0
+) -> np.ndarray:
+    """Clustered vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(num_topics, dimension))
+    labels = rng.integers(0, num_topics, size=num_vectors)
+    vectors = topics[labels] + 1.2 * rng.normal(size=(num_vectors, dimension))
+    return vectors.astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-vectors", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", default="1,2,4,8,16,32")
+    parser.add_argument("--upsert-batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    os.environ["NAGATO_LOCAL_VECTOR_PATH"] = tempfile.mkdtemp(prefix="nagato-ann-")
+    from nagato.service.vectordb import LocalIVFVectorService, LocalVectorService
+
+    vectors = synthetic_vectors(args.num_vectors + args.num_queries, args.dimension)
+    corpus, queries = vectors[: args.num_vectors], vectors[args.num_vectors :]
+    exact = LocalVectorService(index_name="exact", dimension=args.dimension)
+    ann = LocalIVFVectorService(index_name="ivf", dimension=args.dimension)
+    started = time.perf_counter()
+    for start in range(0, len(corpus), args.upsert_batch_size):
+        batch = [
+            (str(start + i), vector, {})
+            for i, vector in enumerate(corpus[start : start + args.upsert_batch_size])
+        ]
+        exact.upsert(vectors=batch)
+        ann.upsert(vectors=batch)
+    build_seconds = time.perf_counter() - started
+
+    def run(service, **options):
+        results = []
+        started = time.perf_counter()
+        for query in queries:
+            matches = service.query(queries=[query], top_k=args.top_k, **options)
+            results.append({match["id"] for match in matches})
+        return results, len(queries) / (time.perf_counter() - started)
+
+    truth, exact_qps = run(exact)
+    report = {
+        "benchmark": "ann_recall",
+        "num_vectors": args.num_vectors,
+        "dimension": args.dimension,
+        "top_k": args.top_k,
+        "nlist": len(ann.ivf.centroids) if ann.ivf.trained else 0,
+        "build_seconds": build_seconds,
+        "exact_qps": exact_qps,
+        "ivf": [],
+    }
+    for nprobe in [int(value) for value in args.nprobe.split(",")]:
+        found, qps = run(ann, nprobe=nprobe)
+        recall = np.mean(
+            [len(hits & expected) / args.top_k for hits, expected in zip(found, truth)]
+        )
+        report["ivf"].append(
+            {"nprobe": nprobe, f"recall@{args.top_k}": recall, "qps": qps}
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Synthetic, reproducible text corpora for the benchmarks."""
+
+import os
+from typing import List
+
+import numpy as np
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "to", "ne", "su", "vi", "de", "po", "an", "el"]
+
+
+def vocabulary(size: int = 5000, seed: int = 0) -> List[str]:
+    rng = np.random.default_rng(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES, size=rng.integers(1, 5))))
+    return sorted(words)
+
+
+def synthetic_document(
+    index: int, num_words: int = 2000, words: List[str] = None, seed: int = 0
+) -> str:
+    """Zipf-distributed words in sentences and paragraphs, with a sprinkling
+    of ticker-like tokens and figures as they occur in financial reports."""
+    words = words or vocabulary()
+    rng = np.random.default_rng(seed * 1_000_003 + index)
+    ranks = np.minimum(rng.zipf(1.2, size=num_words), len(words)) - 1
+    tokens = [words[rank] for rank in ranks]
+    for position in rng.integers(0, num_words, size=max(1, num_words // 200)):
+        ticker = rng.choice(["TSLA", "AAPL", "NVDA"])
+        tokens[position] = f"{ticker}-{rng.integers(1000)}"
+    sentences, start = [], 0
+    while start < num_words:
+        length = int(rng.integers(8, 25))
+        sentence = " ".join(tokens[start : start + length])
+        sentences.append(sentence[:1].upper() + sentence[1:] + ".")
+        start += length
+    paragraphs = [" ".join(sentences[i : i + 6]) for i in range(0, len(sentences), 6)]
+    return "\n\n".join(paragraphs)
+
+
+def write_corpus(
+    directory: str, num_documents: int, num_words: int = 2000, seed: int = 0
+) -> List[str]:
+    """Write `num_documents` text files into `directory` and return their paths."""
+    os.makedirs(directory, exist_ok=True)
+    words = vocabulary(seed=seed)
+    paths = []
+    for index in range(num_documents):
+        path = os.path.join(directory, f"doc-{index:05d}.txt")
+        with open(path, "w") as f:
+            f.write(synthetic_document(index, num_words, words=words, seed=seed))
+        paths.append(path)
+    return paths
+
+
+def synthetic_questions(num_questions: int, seed: int = 0) -> List[str]:
+    words = vocabulary(seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    return [
+        f"What does the report say about {' '.join(rng.choice(words, size=3))}?"
+        for _ in range(num_questions)
+    ]
@@ -0,0 +1,254 @@
+"""Deterministic local stand-ins for the remote services nagato talks to.
+
+Every fake sleeps for a configurable latency, so benchmarks measure
+nagato's own overhead plus a controlled, reproducible service cost.
+`patched_services` installs all of them for the duration of a block.
+"""
+
+import hashlib
+import json
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from typing import Dict, List
+from unittest import mock
+
+import numpy as np
+
+
+@dataclass
+class Latencies:
+    """Simulated service latencies, in seconds."""
+
+    encode_per_text: float = 0.0005
+    vector_upsert: float = 0.02
+    vector_query: float = 0.03
+    rerank: float = 0.05
+    completion: float = 0.3
+    first_token: float = 0.2
+    per_token: float = 0.005
+    download_per_mib: float = 0.05
+
+
+def text_vector(text: str, dimension: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).normal(size=dimension).astype(np.float32)
+
+
+class FakeEncoder:
+    """Sentence-transformer lookalike returning hash-seeded random vectors."""
+
+    def __init__(self, dimension: int = 384, seconds_per_text: float = 0.0):
+        self.dimension = dimension
+        self.seconds_per_text = seconds_per_text
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def encode(self, sentences: List[str], **kwargs) -> np.ndarray:
+        time.sleep(self.seconds_per_text * len(sentences))
+        return np.vstack(
+            [text_vector(text, self.dimension) for text in sentences]
+            or [np.empty((0, self.dimension), dtype=np.float32)]
+        )
+
+
+def fake_vector_service(latencies: Latencies):
+    """`LocalVectorService` with Pinecone-like round-trip latency."""
+    from nagato.service.vectordb import LocalVectorService, VectorDBService
+
+    class FakePineconeVectorService(LocalVectorService):
+        def upsert(self, vectors):
+            time.sleep(latencies.vector_upsert)
+            return super().upsert(vectors=vectors)
+
+        def query(self, queries, top_k: int, include_metadata: bool = True):
+            time.sleep(latencies.vector_query)
+            return super().query(
+                queries=queries, top_k=top_k, include_metadata=include_metadata
+            )
+
+        def query_many(
+            self,
+            queries,
+            top_k: int,
+            include_metadata: bool = True,
+            max_concurrency: int = 8,
+        ):
+            # One round-trip per query, like the remote service
+            return VectorDBService.query_many(
+                self,
+                queries=queries,
+                top_k=top_k,
+                include_metadata=include_metadata,
+                max_concurrency=max_concurrency,
+            )
+
+    return FakePineconeVectorService
+
+
+def fake_rerank_service(latencies: Latencies):
+    from nagato.service.rerank import RerankService, as_match
+
+    class FakeRerankService(RerankService):
+        def rerank(self, query: str, documents: list, top_n: int = 3) -> List[dict]:
+            time.sleep(latencies.rerank)
+            return [as_match(doc) for doc in documents[:top_n]]
+
+    return FakeRerankService()
+
+
+def fake_completion(latencies: Latencies, num_tokens: int = 60):
+    """`litellm.completion` replacement answering with `num_tokens` words."""
+
+    def completion(model: str, messages: List[Dict], stream: bool = False, **kwargs):
+        words = [f"token{i}" for i in range(num_tokens)]
+        if not stream:
+            time.sleep(latencies.completion)
+            return {
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(words)},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+
+        def chunks():
+            time.sleep(latencies.first_token)
+            for word in words:
+                yield {"choices": [{"delta": {"content": word + " "}}]}
+                time.sleep(latencies.per_token)
+            yield {"choices": [{"delta": {"content": None}}]}
+
+        return chunks()
+
+    return completion
+
+
+class _Message:
+    def __init__(self, content: str):
+        self.message = type("Message", (), {"content": content})()
+
+
+def fake_chat_completion(latencies: Latencies):
+    """`openai.ChatCompletion.create` replacement producing Q&A JSONL.
+
+    Questions are built from words of the prompt's context, so they are
+    distinct enough to survive near-duplicate filtering.
+    """
+
+    def create(model: str, messages: List[Dict], **kwargs):
+        time.sleep(latencies.completion)
+        prompt = messages[-1]["content"]
+        count = int(re.search(r"question/answer pairs: (\d+)", prompt).group(1))
+        words = re.findall(r"[a-z]+", prompt.split("Context:")[-1].lower()) or ["x"]
+        rng = np.random.default_rng(len(prompt) + count)
+        lines = []
+        for _ in range(count):
+            question = " ".join(rng.choice(words, size=8)) + "?"
+            answer = " ".join(rng.choice(words, size=12)) + "."
+            lines.append(
+                json.dumps(
+                    {
+                        "messages": [
+                            {"role": "system", "content": "You are an expert."},
+                            {"role": "user", "content": question},
+                            {"role": "assistant", "content": answer},
+                        ]
+                    }
+                )
+            )
+        return type("Completion", (), {"choices": [_Message("\n".join(lines))]})()
+
+    return create
+
+
+class _FakeResponse:
+    def __init__(self, body: bytes, latencies: Latencies):
+        self.body = body
+        self.latencies = latencies
+        self.status_code = 200
+        self.headers = {"content-length": str(len(body))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, block_size: int):
+        for start in range(0, len(self.body), block_size):
+            block = self.body[start : start + block_size]
+            time.sleep(self.latencies.download_per_mib * len(block) / (1 << 20))
+            yield block
+
+
+def fake_http_get(documents: Dict[str, bytes], latencies: Latencies):
+    """`requests.get` replacement serving `documents` keyed by URL."""
+
+    def get(url: str, stream: bool = False, headers: Dict = None, timeout=None):
+        return _FakeResponse(documents[url], latencies)
+
+    return get
+
+
+@contextmanager
+def patched_services(
+    latencies: Latencies,
+    embedding_models: Dict[str, int],
+    documents: Dict[str, bytes] = None,
+):
+    """Replace Pinecone, Cohere, litellm, OpenAI and HTTP downloads with fakes.
+
+    `embedding_models` maps every model name nagato will load (both the
+    sentence-transformers name and the index name used for queries) to its
+    dimension; a `FakeEncoder` is registered for each of them.
+    """
+    from nagato.service import rerank
+    from nagato.service.vectordb import clear_vector_service_cache
+    from nagato.utils.model_registry import model_registry
+
+    for model_name, dimension in embedding_models.items():
+        model_registry.register(
+            model_name=model_name,
+            model=FakeEncoder(
+                dimension=dimension, seconds_per_text=latencies.encode_per_text
+            ),
+        )
+    reranker = fake_rerank_service(latencies)
+    clear_vector_service_cache()
+    with ExitStack() as stack:
+        stack.enter_context(
+            mock.patch(
+                "nagato.service.vectordb.PineconeVectorService",
+                fake_vector_service(latencies),
+            )
+        )
+        stack.enter_context(
+            mock.patch.dict(
+                rerank._rerank_services, {"COHERE": reranker, "CROSS_ENCODER": reranker}
+            )
+        )
+        stack.enter_context(
+            mock.patch("litellm.completion", fake_completion(latencies))
+        )
+        stack.enter_context(
+            mock.patch("openai.ChatCompletion.create", fake_chat_completion(latencies))
+        )
+        stack.enter_context(
+            mock.patch(
+                "nagato.utils.download.requests.get",
+                fake_http_get(documents or {}, latencies),
+            )
+        )
+        yield
+    clear_vector_service_cache()
+    for model_name in embedding_models:
+        model_registry.evict(model_name=model_name)
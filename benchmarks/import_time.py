@@ -0,0 +1,86 @@
+"""Cold-start import time of nagato entry points.
+
+    python -m benchmarks.import_time --repeat 5
+
+Every measurement imports the module in a fresh interpreter with
+`-X importtime`, so nothing is cached between runs. The report also lists
+which heavy dependencies each entry point pulled in.
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+TARGETS = [
+    "nagato",
+    "nagato.service",
+    "nagato.service.query",
+    "nagato.service.finetune",
+]
+
+HEAVY_MODULES = [
+    "llama_index",
+    "pinecone",
+    "openai",
+    "replicate",
+    "litellm",
+    "tqdm",
+    "sentence_transformers",
+    "torch",
+    "tiktoken",
+    "cohere",
+]
+
+
+def import_seconds(target: str) -> float:
+    """Cumulative import time of `target` in a fresh interpreter."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == target:
+            return int(fields[1]) / 1e6
+    raise RuntimeError(f"No import time reported for {target}")
+
+
+def loaded_heavy_modules(target: str) -> list:
+    code = (
+        f"import sys, json, {target}; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    report = {"benchmark": "import_time", "python": sys.version.split()[0]}
+    report["targets"] = []
+    for target in args.targets.split(","):
+        samples = [import_seconds(target) for _ in range(args.repeat)]
+        report["targets"].append(
+            {
+                "module": target,
+                "median_seconds": float(np.median(samples)),
+                "min_seconds": float(np.min(samples)),
+                "heavy_modules": loaded_heavy_modules(target),
+            }
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""End-to-end scenario benchmarks against local fakes of every remote service.
+
+    python -m benchmarks.scenarios --scenarios ingestion,query,finetune \
+        --num-documents 200 --num-queries 100 --output results.jsonl
+
+Pinecone, Cohere, litellm, OpenAI and HTTP downloads are replaced by the
+fakes in `benchmarks.fakes` with the latencies given on the command line,
+and the embedding model by a hash-based encoder, so runs need no network or
+credentials (tiktoken's encoding file must be in its cache) and are
+reproducible. Each run prints one JSON report, which `--output` also
+appends as a line to a JSONL file for tracking results over time.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+from dataclasses import asdict, fields
+
+import numpy as np
+
+from benchmarks.corpus import synthetic_document, synthetic_questions, write_corpus
+from benchmarks.fakes import Latencies, patched_services
+
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+
+class SyntheticNode:
+    def __init__(self, id_: str, text: str):
+        self.id_ = id_
+        self.text = text
+
+
+def latency_summary(samples) -> dict:
+    samples = np.asarray(samples)
+    return {
+        "count": int(len(samples)),
+        "mean": float(samples.mean()),
+        "p50": float(np.percentile(samples, 50)),
+        "p90": float(np.percentile(samples, 90)),
+        "p99": float(np.percentile(samples, 99)),
+    }
+
+
+def ingest_corpus(
+    directory: str, args, filter_id: str, lexical_index: bool = None
+) -> dict:
+    from nagato.service import create_vector_embeddings_bulk
+
+    paths = write_corpus(directory, args.num_documents, num_words=args.num_words)
+    started = time.perf_counter()
+    statuses = create_vector_embeddings_bulk(
+        sources=[
+            {"type": "TXT", "filter_id": filter_id, "path": path} for path in paths
+        ],
+        model=EMBEDDING_MODEL,
+        embedding_provider="PINECONE",
+        max_workers=args.workers,
+        lexical_index=args.hybrid if lexical_index is None else lexical_index,
+    )
+    seconds = time.perf_counter() - started
+    chunks = sum(status["num_chunks"] for status in statuses)
+    return {
+        "documents": len(paths),
+        "chunks": chunks,
+        "failed": sum(status["status"] == "FAILED" for status in statuses),
+        "seconds": seconds,
+        "documents_per_second": len(paths) / seconds,
+        "chunks_per_second": chunks / seconds,
+    }
+
+
+def ingestion(args, workdir: str) -> dict:
+    return ingest_corpus(os.path.join(workdir, "ingestion"), args, "bench-ingestion")
+
+
+def url_ingestion(args, workdir: str, documents: dict) -> dict:
+    from nagato.service import create_vector_embeddings
+
+    started = time.perf_counter()
+    for url in documents:
+        create_vector_embeddings(
+            type="TXT", model=EMBEDDING_MODEL, filter_id="bench-url", url=url
+        )
+    seconds = time.perf_counter() - started
+    return {
+        "documents": len(documents),
+        "bytes": sum(len(body) for body in documents.values()),
+        "seconds": seconds,
+        "documents_per_second": len(documents) / seconds,
+    }
+
+
+def query(args, workdir: str) -> dict:
+    from nagato.service import predict_with_embedding
+
+    ingest_corpus(os.path.join(workdir, "query"), args, "bench-query")
+    latencies = []
+    for question in synthetic_questions(args.num_queries):
+        started = time.perf_counter()
+        predict_with_embedding(
+            input=question,
+            provider="OPENAI",
+            model="gpt-3.5-turbo",
+            vector_db="PINECONE",
+            embedding_model=EMBEDDING_MODEL,
+            embedding_filter_id="bench-query",
+            enable_streaming=True,
+            callback=lambda chunk: None,
+            pipelined=args.pipelined,
+            hybrid=args.hybrid,
+        )
+        latencies.append(time.perf_counter() - started)
+    return {
+        "queries": args.num_queries,
+        "pipelined": args.pipelined,
+        "hybrid": args.hybrid,
+        "qps": len(latencies) / sum(latencies),
+        "latency": latency_summary(latencies),
+    }
+
+
+def batch_query(args, workdir: str) -> dict:
+    from nagato.service import query_documents, query_documents_many
+
+    ingest_corpus(os.path.join(workdir, "batch_query"), args, "bench-batch-query")
+    questions = synthetic_questions(args.num_queries)
+    options = {
+        "model": EMBEDDING_MODEL,
+        "vector_db": "PINECONE",
+        "filter_id": "bench-batch-query",
+        "hybrid": args.hybrid,
+    }
+    started = time.perf_counter()
+    for question in questions:
+        query_documents(query=question, **options)
+    sequential = time.perf_counter() - started
+    started = time.perf_counter()
+    query_documents_many(
+        queries=questions, max_concurrency=args.query_concurrency, **options
+    )
+    batched = time.perf_counter() - started
+    return {
+        "queries": len(questions),
+        "concurrency": args.query_concurrency,
+        "sequential_seconds": sequential,
+        "batched_seconds": batched,
+        "sequential_qps": len(questions) / sequential,
+        "batched_qps": len(questions) / batched,
+        "speedup": sequential / batched,
+    }
+
+
+def exact_match(args, workdir: str) -> dict:
+    """Recall of chunks containing a ticker-like token when asked about it,
+    with vector-only and hybrid retrieval (no reranking)."""
+    from nagato.service import query_documents
+
+    directory = os.path.join(workdir, "exact_match")
+    ingest_corpus(directory, args, "bench-exact-match", lexical_index=True)
+    tickers = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            tickers.extend(re.findall(r"\b[A-Z]{4}-\d+\b", f.read()))
+    tickers = sorted(set(tickers))[: args.num_queries]
+    report = {"queries": len(tickers)}
+    for mode, hybrid in (("vector", False), ("hybrid", True)):
+        hits, latencies = 0, []
+        for ticker in tickers:
+            started = time.perf_counter()
+            docs = query_documents(
+                query=f"What does the report say about {ticker}?",
+                model=EMBEDDING_MODEL,
+                vector_db="PINECONE",
+                filter_id="bench-exact-match",
+                re_rank=False,
+                hybrid=hybrid,
+            )
+            latencies.append(time.perf_counter() - started)
+            hits += any(ticker in doc["metadata"]["content"] for doc in docs)
+        report[mode] = {
+            "recall": hits / max(len(tickers), 1),
+            "latency": latency_summary(latencies),
+        }
+    return report
+
+
+def finetune(args, workdir: str) -> dict:
+    from nagato.service.finetune import get_finetuning_service
+
+    nodes = [
+        SyntheticNode(id_=f"node-{i}", text=synthetic_document(i, num_words=250))
+        for i in range(args.num_nodes)
+    ]
+    service = get_finetuning_service(
+        nodes=nodes,
+        provider="OPENAI",
+        base_model="GPT_35_TURBO",
+        num_questions_per_chunk=args.questions_per_chunk,
+        batch_size=args.finetune_concurrency,
+    )
+    started = time.perf_counter()
+    service.generate_dataset(training_file=os.path.join(workdir, "dataset.jsonl"))
+    seconds = time.perf_counter() - started
+    return {
+        "nodes": len(nodes),
+        "concurrency": args.finetune_concurrency,
+        "seconds": seconds,
+        "nodes_per_second": len(nodes) / seconds,
+        "pairs_per_second": service.stats["valid"] / seconds,
+        "dataset": service.stats,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--scenarios",
+        default="ingestion,url_ingestion,query,batch_query,exact_match,finetune",
+    )
+    parser.add_argument("--num-documents", type=int, default=50)
+    parser.add_argument("--num-words", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument("--hybrid", action="store_true")
+    parser.add_argument("--query-concurrency", type=int, default=8)
+    parser.add_argument("--num-nodes", type=int, default=50)
+    parser.add_argument("--questions-per-chunk", type=int, default=10)
+    parser.add_argument("--finetune-concurrency", type=int, default=10)
+    parser.add_argument("--output", default=None)
+    for field in fields(Latencies):
+        parser.add_argument(
+            f"--{field.name.replace('_', '-')}-latency",
+            dest=field.name,
+            type=float,
+            default=field.default,
+        )
+    args = parser.parse_args()
+    latencies = Latencies(
+        **{field.name: getattr(args, field.name) for field in fields(Latencies)}
+    )
+
+    workdir = tempfile.mkdtemp(prefix="nagato-bench-")
+    os.environ.update(
+        {
+            "NAGATO_LOCAL_VECTOR_PATH": os.path.join(workdir, "vectors"),
+            "NAGATO_MANIFEST_PATH": os.path.join(workdir, "manifests"),
+            "NAGATO_LEXICAL_INDEX_PATH": os.path.join(workdir, "bm25"),
+            "NAGATO_EMBEDDING_CACHE_PATH": "",
+            "NAGATO_QUERY_CACHE_SIZE": "0",
+            "NAGATO_COMPLETION_CACHE_SIZE": "0",
+            "NAGATO_COMPLETION_CACHE_PATH": "",
+        }
+    )
+    from nagato.service.embedding import MODEL_TO_INDEX
+    from nagato.utils.metrics import metrics
+
+    dimension = MODEL_TO_INDEX[EMBEDDING_MODEL]["dimensions"]
+    documents = {
+        f"https://bench.local/doc-{i}.txt": synthetic_document(
+            i, num_words=args.num_words
+        ).encode()
+        for i in range(args.num_documents)
+    }
+    scenarios = {
+        "ingestion": lambda: ingestion(args, workdir),
+        "url_ingestion": lambda: url_ingestion(args, workdir, documents),
+        "query": lambda: query(args, workdir),
+        "batch_query": lambda: batch_query(args, workdir),
+        "exact_match": lambda: exact_match(args, workdir),
+        "finetune": lambda: finetune(args, workdir),
+    }
+    report = {
+        "benchmark": "scenarios",
+        "timestamp": time.time(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "latencies": asdict(latencies),
+        "scenarios": {},
+    }
+    metrics.enabled = True
+    with patched_services(
+        latencies=latencies,
+        embedding_models={
+            EMBEDDING_MODEL: dimension,
+            MODEL_TO_INDEX[EMBEDDING_MODEL]["index_name"]: dimension,
+        },
+        documents=documents,
+    ):
+        for name in args.scenarios.split(","):
+            metrics.reset()
+            result = scenarios[name]()
+            report["scenarios"][name] = {**result, "stages": metrics.snapshot()}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,16 @@
 # flake8: noqa
 
-from .service import create_finetuned_model, create_vector_embeddings
+__all__ = [
+    "create_finetuned_model",
+    "create_vector_embeddings",
+    "create_vector_embeddings_bulk",
+]
+
+
+def __getattr__(name):
+    # Imported on first use so `import nagato` stays cheap
+    if name in __all__:
+        from nagato import service
+
+        return getattr(service, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
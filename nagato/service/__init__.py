@@ -1,24 +1,129 @@
-from typing import Callable, List
+from typing import BinaryIO, Callable, Dict, List, Union
 
-import requests
+from decouple import config
 
+# Only what ingestion and retrieval need is imported eagerly; the LLM
+# (litellm, openai) and fine-tuning stacks are imported by the functions
+# that use them, so query-only and ingestion-only workers start faster.
 from nagato.service.embedding import (
-    MODEL_TO_INDEX,
     EmbeddingService,
-    get_vector_service,
+    aembed_queries,
+    embed_queries,
+    get_model_vector_service,
+    model_index,
 )
-from nagato.service.finetune import get_finetuning_service
-from nagato.service.query import QueryService
-from nagato.utils.lazy_model_loader import LazyModelLoader
+from nagato.service.ingestion import create_vector_embeddings_bulk
+from nagato.service.lexical import (
+    get_lexical_index,
+    index_nodes,
+    reciprocal_rank_fusion,
+)
+from nagato.utils.aio import run_in_executor
+from nagato.utils.manifest import IngestionManifest, manifest_enabled
+from nagato.utils.metrics import metrics
+from nagato.utils.model_registry import model_registry
+
+__all__ = [
+    "acreate_vector_embeddings",
+    "apredict",
+    "apredict_with_embedding",
+    "aquery_documents",
+    "aquery_documents_many",
+    "aquery_embedding",
+    "aquery_embeddings",
+    "create_finetuned_model",
+    "create_vector_embeddings",
+    "create_vector_embeddings_bulk",
+    "predict",
+    "predict_with_embedding",
+    "query_documents",
+    "query_documents_many",
+    "query_embedding",
+    "query_embeddings",
+    "warmup_embedding_models",
+]
 
 
 def create_vector_embeddings(
-    type: str, model: str, filter_id: str, url: str = None, content: str = None
+    type: str,
+    model: str,
+    filter_id: str,
+    url: str = None,
+    content: str = None,
+    path: str = None,
+    file: BinaryIO = None,
+    checksum: str = None,
+    document_id: str = None,
+    embedding_provider: str = "PINECONE",
+    incremental: bool = False,
+    lexical_index: bool = None,
 ) -> List:
-    embedding_service = EmbeddingService(type=type, content=content, url=url)
-    documents = embedding_service.generate_documents()
+    """Embed a document into `filter_id` and return the nodes that were embedded.
+
+    With `incremental` (or whenever NAGATO_MANIFEST_PATH is set) the
+    document's content hash and chunk ids are recorded in the manifest of
+    the provider, index and `filter_id`, and vectors of chunks that no
+    longer exist are deleted. With `incremental`, an unchanged document is
+    skipped entirely, and only chunks that are not already stored get
+    embedded. With `lexical_index`
+    (default NAGATO_LEXICAL_INDEX) the chunks are also added to the BM25
+    index of `filter_id` used by `hybrid` queries.
+    """
+    if lexical_index is None:
+        lexical_index = config("NAGATO_LEXICAL_INDEX", default=False, cast=bool)
+    embedding_service = EmbeddingService(
+        type=type,
+        content=content,
+        url=url,
+        path=path,
+        file=file,
+        checksum=checksum,
+        document_id=document_id,
+    )
+    manifest = (
+        IngestionManifest(
+            filter_id=filter_id,
+            index_name=model_index(model)["index_name"],
+            provider=embedding_provider,
+        )
+        if manifest_enabled(incremental=incremental)
+        else None
+    )
+    previous = (manifest and manifest.get(embedding_service.source_key)) or {}
+    documents = embedding_service.generate_documents(
+        previous_hash=previous.get("hash") if incremental else None
+    )
+    if incremental and embedding_service.content_hash == previous.get("hash"):
+        return []
     nodes = embedding_service.generate_chunks(documents=documents)
-    embedding_service.generate_embeddings(nodes=nodes, filter_id=filter_id, model=model)
+    chunk_ids = [node.id_ for node in nodes]
+    previous_ids = set(previous.get("chunks", []))
+    if incremental:
+        nodes = [node for node in nodes if node.id_ not in previous_ids]
+    embedding_service.generate_embeddings(
+        nodes=nodes,
+        filter_id=filter_id,
+        model=model,
+        embedding_provider=embedding_provider,
+        return_embeddings=False,
+    )
+    stale_ids = previous_ids.difference(chunk_ids)
+    if stale_ids:
+        embedding_service.delete_embeddings(
+            ids=list(stale_ids),
+            filter_id=filter_id,
+            model=model,
+            embedding_provider=embedding_provider,
+        )
+    if lexical_index:
+        index_nodes(nodes=nodes, filter_id=filter_id, stale_ids=stale_ids)
+    if manifest is not None:
+        manifest.set(
+            source_key=embedding_service.source_key,
+            content_hash=embedding_service.content_hash,
+            chunk_ids=chunk_ids,
+        )
+        manifest.save()
     return nodes
 
 
@@ -30,8 +135,22 @@ def create_finetuned_model(
     content: str = None,
     webhook_url: str = None,
     num_questions_per_chunk: int = 10,
+    path: str = None,
+    file: BinaryIO = None,
+    training_file: str = None,
 ) -> dict:
-    embedding_service = EmbeddingService(type=type, url=url, content=content)
+    """Generate a Q&A dataset from the document and fine-tune `base_model` on it.
+
+    Pass the same `training_file` again after a crash to resume dataset
+    generation from its checkpoint instead of starting over.
+    """
+    import requests
+
+    from nagato.service.finetune import get_finetuning_service
+
+    embedding_service = EmbeddingService(
+        type=type, url=url, content=content, path=path, file=file
+    )
     documents = embedding_service.generate_documents()
     nodes = embedding_service.generate_chunks(documents=documents)
     finetunning_service = get_finetuning_service(
@@ -41,7 +160,7 @@ def create_finetuned_model(
         base_model=base_model,
         num_questions_per_chunk=num_questions_per_chunk,
     )
-    training_file = finetunning_service.generate_dataset()
+    training_file = finetunning_service.generate_dataset(training_file=training_file)
     formatted_training_file = finetunning_service.validate_dataset(
         training_file=training_file
     )
@@ -62,6 +181,8 @@ def predict(
     callback: Callable = None,
     enable_streaming: bool = False,
 ) -> dict:
+    from nagato.service.query import QueryService
+
     query_service = QueryService(provider=provider, model=model)
     output = query_service.predict(
         input=input,
@@ -78,28 +199,125 @@ def predict_with_embedding(
     model: str,
     vector_db: str,
     embedding_model: str,
-    embedding_filter_id: str,
+    embedding_filter_id: Union[str, List[str]],
     callback: Callable = None,
     system_prompt: str = "You are a helpful assistant",
     enable_streaming: bool = False,
+    pipelined: bool = False,
+    rerank_hedge_after: float = None,
+    on_timings: Callable[[Dict[str, float]], None] = None,
+    semantic_cache: bool = False,
+    max_tokens: int = 2000,
+    hybrid: bool = False,
 ) -> dict:
-    context = query_embedding(
+    """Answer `input` from the context retrieved for it.
+
+    The reranked documents are packed into the prompt up to the token
+    budget the model's context window leaves after `max_tokens`. With
+    `semantic_cache`, answers are reused for questions similar to an earlier
+    one (see `SemanticAnswerCache`) as long as the retrieved context is the
+    same. With `hybrid`, retrieval also uses the BM25 index (see
+    `query_documents`).
+    """
+    from nagato.service.pipeline import pipelined_predict_with_embedding
+    from nagato.service.query import QueryService
+    from nagato.service.semantic_cache import (
+        SemanticAnswerCache,
+        cached_predict_with_embedding,
+    )
+
+    if pipelined or not isinstance(embedding_filter_id, (str, type(None))):
+        return pipelined_predict_with_embedding(
+            input=input,
+            provider=provider,
+            model=model,
+            vector_db=vector_db,
+            embedding_model=embedding_model,
+            embedding_filter_id=embedding_filter_id,
+            callback=callback,
+            system_prompt=system_prompt,
+            enable_streaming=enable_streaming,
+            rerank_hedge_after=rerank_hedge_after,
+            on_timings=on_timings,
+            semantic_cache=semantic_cache,
+            max_tokens=max_tokens,
+            hybrid=hybrid,
+        )
+    context = query_documents(
         query=input,
         model=embedding_model,
         filter_id=embedding_filter_id,
         vector_db=vector_db,
+        hybrid=hybrid,
     )
     query_service = QueryService(provider=provider, model=model)
+    if semantic_cache:
+        index = model_index(embedding_model)
+        model_name = index["index_name"]
+        return cached_predict_with_embedding(
+            cache=SemanticAnswerCache(
+                index_name=model_name,
+                dimension=index["dimensions"],
+                filter_id=embedding_filter_id,
+            ),
+            query_service=query_service,
+            embedding=embed_queries(queries=[input], model_name=model_name)[0].tolist(),
+            input=input,
+            context=context,
+            system_prompt=system_prompt,
+            enable_streaming=enable_streaming,
+            callback=callback,
+            max_tokens=max_tokens,
+        )
     output = query_service.predict_with_embedding(
         input=input,
         callback=callback,
         enable_streaming=enable_streaming,
         context=context,
         system_prompt=system_prompt,
+        max_tokens=max_tokens,
     )
     return output
 
 
+def query_documents(
+    query: str,
+    model: str = "thenlper/gte-small",
+    vector_db: str = "PINECONE",
+    filter_id: str = None,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
+) -> List:
+    """All `top_k` matches retrieved (and reranked) for `query`, best first, as
+    `{"id", "score", "metadata"}` dicts.
+
+    With `hybrid`, the vector matches are fused (RRF) with the `top_k` best
+    BM25 matches from the lexical index of `filter_id` before reranking, so
+    exact terms such as tickers and figures are found too.
+    """
+    model_name = model_index(model)["index_name"]
+    vectordb = get_model_vector_service(
+        model=model, provider=vector_db, filter_id=filter_id
+    )
+    embedding = embed_queries(queries=[query], model_name=model_name).tolist()
+    with metrics.timer("query"):
+        docs = vectordb.query(queries=embedding, top_k=top_k, include_metadata=True)
+    if hybrid:
+        with metrics.timer("lexical"):
+            lexical = get_lexical_index(filter_id=filter_id).search(
+                query=query, top_k=top_k
+            )
+        docs = reciprocal_rank_fusion([docs, lexical], top_k=top_k)
+    if re_rank:
+        with metrics.timer("rerank", items=len(docs)):
+            docs = vectordb.rerank(
+                query=query, documents=docs, top_n=top_k, provider=rerank_provider
+            )
+    return docs
+
+
 def query_embedding(
     query: str,
     model: str = "thenlper/gte-small",
@@ -107,18 +325,294 @@ def query_embedding(
     filter_id: str = None,
     top_k: int = 5,
     re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
 ) -> dict:
-    model_name = MODEL_TO_INDEX[model.split("/")[-1]].get("index_name")
-    model_dimensions = MODEL_TO_INDEX[model.split("/")[-1]].get("dimensions")
-    embedding_model = LazyModelLoader(model_name=model_name)
-    vectordb = get_vector_service(
-        provider=vector_db,
-        index_name=model_name,
+    return query_documents(
+        query=query,
+        model=model,
+        vector_db=vector_db,
+        filter_id=filter_id,
+        top_k=top_k,
+        re_rank=re_rank,
+        rerank_provider=rerank_provider,
+        hybrid=hybrid,
+    )[0]
+
+
+def query_documents_many(
+    queries: List[str],
+    model: str = "thenlper/gte-small",
+    vector_db: str = "PINECONE",
+    filter_id: str = None,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
+    max_concurrency: int = None,
+) -> List[List]:
+    """`query_documents` for every query in `queries`, in the same order.
+
+    All queries are encoded in one batched pass, vector searches run at most
+    `max_concurrency` (default NAGATO_QUERY_CONCURRENCY) at a time, and
+    reranking goes through the reranker's batch API.
+    """
+    if not queries:
+        return []
+    max_concurrency = max_concurrency or config(
+        "NAGATO_QUERY_CONCURRENCY", default=8, cast=int
+    )
+    model_name = model_index(model)["index_name"]
+    vectordb = get_model_vector_service(
+        model=model, provider=vector_db, filter_id=filter_id
+    )
+    embeddings = embed_queries(queries=queries, model_name=model_name).tolist()
+    with metrics.timer("query", items=len(queries)):
+        docs = vectordb.query_many(
+            queries=embeddings,
+            top_k=top_k,
+            include_metadata=True,
+            max_concurrency=max_concurrency,
+        )
+    if hybrid:
+        index = get_lexical_index(filter_id=filter_id)
+        with metrics.timer("lexical", items=len(queries)):
+            docs = [
+                reciprocal_rank_fusion(
+                    [matches, index.search(query=query, top_k=top_k)], top_k=top_k
+                )
+                for query, matches in zip(queries, docs)
+            ]
+    if re_rank:
+        with metrics.timer("rerank", items=sum(len(matches) for matches in docs)):
+            docs = vectordb.rerank_many(
+                queries=queries,
+                documents=docs,
+                top_n=top_k,
+                provider=rerank_provider,
+                max_concurrency=max_concurrency,
+            )
+    return docs
+
+
+def query_embeddings(
+    queries: List[str],
+    model: str = "thenlper/gte-small",
+    vector_db: str = "PINECONE",
+    filter_id: str = None,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
+    max_concurrency: int = None,
+) -> List[dict]:
+    """The best document for every query in `queries` (None if none matched)."""
+    docs = query_documents_many(
+        queries=queries,
+        model=model,
+        vector_db=vector_db,
+        filter_id=filter_id,
+        top_k=top_k,
+        re_rank=re_rank,
+        rerank_provider=rerank_provider,
+        hybrid=hybrid,
+        max_concurrency=max_concurrency,
+    )
+    return [matches[0] if matches else None for matches in docs]
+
+
+def warmup_embedding_models(models: List[str]) -> None:
+    """Load `models` into the shared model registry ahead of the first query."""
+    model_registry.warmup(model_names=models)
+
+
+async def acreate_vector_embeddings(
+    type: str,
+    model: str,
+    filter_id: str,
+    url: str = None,
+    content: str = None,
+    path: str = None,
+    file: BinaryIO = None,
+    checksum: str = None,
+    document_id: str = None,
+    embedding_provider: str = "PINECONE",
+    incremental: bool = False,
+    lexical_index: bool = None,
+) -> List:
+    return await run_in_executor(
+        create_vector_embeddings,
+        pool="background",
+        type=type,
+        model=model,
         filter_id=filter_id,
-        dimension=model_dimensions,
+        url=url,
+        content=content,
+        path=path,
+        file=file,
+        checksum=checksum,
+        document_id=document_id,
+        embedding_provider=embedding_provider,
+        incremental=incremental,
+        lexical_index=lexical_index,
+    )
+
+
+async def apredict(
+    input: str,
+    provider: str,
+    model: str,
+    system_prompt: str = None,
+    callback: Callable = None,
+    enable_streaming: bool = False,
+) -> dict:
+    from nagato.service.query import QueryService
+
+    query_service = QueryService(provider=provider, model=model)
+    output = await query_service.apredict(
+        input=input,
+        callback=callback,
+        enable_streaming=enable_streaming,
+        system_prompt=system_prompt,
+    )
+    return output
+
+
+async def apredict_with_embedding(
+    input: str,
+    provider: str,
+    model: str,
+    vector_db: str,
+    embedding_model: str,
+    embedding_filter_id: str,
+    callback: Callable = None,
+    system_prompt: str = "You are a helpful assistant",
+    enable_streaming: bool = False,
+    max_tokens: int = 2000,
+    hybrid: bool = False,
+) -> dict:
+    from nagato.service.query import QueryService
+
+    context = await aquery_documents(
+        query=input,
+        model=embedding_model,
+        filter_id=embedding_filter_id,
+        vector_db=vector_db,
+        hybrid=hybrid,
+    )
+    query_service = QueryService(provider=provider, model=model)
+    output = await query_service.apredict_with_embedding(
+        input=input,
+        callback=callback,
+        enable_streaming=enable_streaming,
+        context=context,
+        system_prompt=system_prompt,
+        max_tokens=max_tokens,
+    )
+    return output
+
+
+async def aquery_documents(
+    query: str,
+    model: str = "thenlper/gte-small",
+    vector_db: str = "PINECONE",
+    filter_id: str = None,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
+) -> List:
+    model_name = model_index(model)["index_name"]
+    vectordb = await run_in_executor(
+        get_model_vector_service, model=model, provider=vector_db, filter_id=filter_id
     )
-    embedding = embedding_model.model.encode([query]).tolist()
-    docs = vectordb.query(queries=embedding, top_k=top_k, include_metadata=True)
+    embedding = (await aembed_queries(queries=[query], model_name=model_name)).tolist()
+    with metrics.timer("query"):
+        docs = await vectordb.aquery(
+            queries=embedding, top_k=top_k, include_metadata=True
+        )
+    if hybrid:
+        with metrics.timer("lexical"):
+            index = await run_in_executor(get_lexical_index, filter_id=filter_id)
+            lexical = await run_in_executor(index.search, query=query, top_k=top_k)
+        docs = reciprocal_rank_fusion([docs, lexical], top_k=top_k)
     if re_rank:
-        docs = vectordb.rerank(query=query, documents=docs, top_n=top_k)
+        with metrics.timer("rerank", items=len(docs)):
+            docs = await vectordb.arerank(
+                query=query, documents=docs, top_n=top_k, provider=rerank_provider
+            )
+    return docs
+
+
+async def aquery_embedding(
+    query: str,
+    model: str = "thenlper/gte-small",
+    vector_db: str = "PINECONE",
+    filter_id: str = None,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
+) -> dict:
+    docs = await aquery_documents(
+        query=query,
+        model=model,
+        vector_db=vector_db,
+        filter_id=filter_id,
+        top_k=top_k,
+        re_rank=re_rank,
+        rerank_provider=rerank_provider,
+        hybrid=hybrid,
+    )
     return docs[0]
+
+
+async def aquery_documents_many(
+    queries: List[str],
+    model: str = "thenlper/gte-small",
+    vector_db: str = "PINECONE",
+    filter_id: str = None,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
+    max_concurrency: int = None,
+) -> List[List]:
+    return await run_in_executor(
+        query_documents_many,
+        pool="background",
+        queries=queries,
+        model=model,
+        vector_db=vector_db,
+        filter_id=filter_id,
+        top_k=top_k,
+        re_rank=re_rank,
+        rerank_provider=rerank_provider,
+        hybrid=hybrid,
+        max_concurrency=max_concurrency,
+    )
+
+
+async def aquery_embeddings(
+    queries: List[str],
+    model: str = "thenlper/gte-small",
+    vector_db: str = "PINECONE",
+    filter_id: str = None,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    hybrid: bool = False,
+    max_concurrency: int = None,
+) -> List[dict]:
+    docs = await aquery_documents_many(
+        queries=queries,
+        model=model,
+        vector_db=vector_db,
+        filter_id=filter_id,
+        top_k=top_k,
+        re_rank=re_rank,
+        rerank_provider=rerank_provider,
+        hybrid=hybrid,
+        max_concurrency=max_concurrency,
+    )
+    return [matches[0] if matches else None for matches in docs]
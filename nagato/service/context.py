@@ -0,0 +1,74 @@
+from typing import Any, List, Union
+
+from nagato.service.rerank import format_document
+from nagato.utils.tokens import count_tokens, truncate_tokens
+
+CHUNK_SEPARATOR = "\n\n"
+
+
+def document_content(document: Any) -> str:
+    if isinstance(document, str):
+        return document
+    if isinstance(document, dict) and "metadata" in document:
+        return document["metadata"]["content"]
+    return str(document)
+
+
+def document_text(document: Any, content: str) -> str:
+    """`document` as it is put in the prompt, with its content replaced."""
+    if isinstance(document, dict) and "metadata" in document:
+        return format_document(
+            {"metadata": {**document["metadata"], "content": content}}
+        )
+    return content
+
+
+def strip_overlap(
+    packed: List[str], text: str, min_overlap: int = 20, max_overlap: int = 1000
+) -> str:
+    """Remove the part of `text` that repeats the start or end of a packed chunk.
+
+    Neighbouring chunks share `chunk_overlap` tokens of text, which would
+    otherwise be sent to the model twice.
+    """
+    for previous in packed:
+        limit = min(len(previous), len(text) - 1, max_overlap)
+        for size in range(limit, min_overlap - 1, -1):
+            if previous.endswith(text[:size]):
+                text = text[size:]
+                break
+            if previous.startswith(text[-size:]):
+                text = text[:-size]
+                break
+    return text.strip()
+
+
+def build_context(documents: Union[str, List[Any]], model: str, max_tokens: int) -> str:
+    """Pack ranked `documents` into at most `max_tokens` tokens of context.
+
+    Documents are taken in rank order. Match dicts, as returned by the
+    vector stores and rerankers, are only formatted here: exact repeats and
+    content that merely repeats the overlap with an already packed chunk are
+    dropped first, and the first document that does not fit is truncated at
+    a clean boundary.
+    """
+    if isinstance(documents, str):
+        documents = [documents]
+    packed, contents, used = [], [], 0
+    separator_tokens = count_tokens(CHUNK_SEPARATOR, model=model)
+    for document in documents:
+        content = strip_overlap(packed=contents, text=document_content(document))
+        if not content or any(content in previous for previous in contents):
+            continue
+        contents.append(content)
+        text = document_text(document, content=content)
+        remaining = max_tokens - used - (separator_tokens if packed else 0)
+        tokens = count_tokens(text, model=model)
+        if tokens > remaining:
+            text = truncate_tokens(text, max_tokens=remaining, model=model)
+            if text:
+                packed.append(text)
+            break
+        packed.append(text)
+        used += tokens + (separator_tokens if len(packed) > 1 else 0)
+    return CHUNK_SEPARATOR.join(packed)
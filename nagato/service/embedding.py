@@ -1,14 +1,26 @@
+import hashlib
+import os
 from tempfile import NamedTemporaryFile
-from typing import List, Union
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Iterator, List, Tuple, Union
 
-import requests
-from llama_index import Document, SimpleDirectoryReader
-from llama_index.node_parser import SimpleNodeParser
+import numpy as np
 from numpy import ndarray
-from tqdm import tqdm
 
-from nagato.service.vectordb import get_vector_service
+from nagato.service.vectordb import VectorDBService, get_vector_service
+from nagato.utils.aio import run_in_executor
+from nagato.utils.batching import BoundedExecutor, batched
+from nagato.utils.embedding_cache import (
+    EmbeddingCache,
+    chunk_embedding_cache,
+    query_embedding_cache,
+)
+from nagato.utils.hashing import chunk_id, sha256_file
 from nagato.utils.lazy_model_loader import LazyModelLoader
+from nagato.utils.metrics import metrics
+from nagato.utils.progress import progress
+
+if TYPE_CHECKING:
+    from llama_index import Document
 
 MODEL_TO_INDEX = {
     "all-MiniLM-L6-v2": {"index_name": "all-minilm-l6-v2", "dimensions": 384},
@@ -25,11 +37,61 @@ MODEL_TO_INDEX = {
 }
 
 
+def model_index(model: str) -> Dict[str, Any]:
+    """The `MODEL_TO_INDEX` entry of `model`, given with or without its
+    organization prefix."""
+    if model in MODEL_TO_INDEX:
+        return MODEL_TO_INDEX[model]
+    return MODEL_TO_INDEX[model.split("/")[-1]]
+
+
+def get_model_vector_service(
+    model: str, provider: str, filter_id: str = None
+) -> VectorDBService:
+    """The vector service of the index that holds `model`'s embeddings."""
+    index = model_index(model)
+    return get_vector_service(
+        provider=provider,
+        index_name=index["index_name"],
+        filter_id=filter_id,
+        dimension=index["dimensions"],
+    )
+
+
 class EmbeddingService:
-    def __init__(self, type: str, url: str = None, content: str = None):
+    def __init__(
+        self,
+        type: str,
+        url: str = None,
+        content: str = None,
+        path: str = None,
+        file: BinaryIO = None,
+        checksum: str = None,
+        document_id: str = None,
+    ):
         self.type = type
         self.url = url
         self.content = content
+        self.path = path
+        self.file = file
+        self.checksum = checksum
+        self.document_id = document_id
+        # Raw content is hashed up front: without a `document_id` it is keyed
+        # by its hash, which manifest lookups need before the source is read
+        self.content_hash = (
+            hashlib.sha256(content).hexdigest() if content is not None else None
+        )
+
+    @property
+    def source_key(self) -> str:
+        """Stable identity of the source document across ingestion runs."""
+        return (
+            self.document_id
+            or self.url
+            or self.path
+            or getattr(self.file, "name", None)
+            or f"content:{self.content_hash}"
+        )
 
     def get_datasource_suffix(self) -> str:
         suffixes = {"TXT": ".txt", "PDF": ".pdf", "MARKDOWN": ".md"}
@@ -38,78 +100,273 @@ class EmbeddingService:
         except KeyError:
             raise ValueError("Unsupported datasource type")
 
-    def generate_documents(self) -> List[Document]:
+    def load_documents(self, path: str) -> List["Document"]:
+        from llama_index import SimpleDirectoryReader
+
+        with progress(total=1, desc="🟠 Processing data") as pbar, metrics.timer(
+            "parse"
+        ):
+            reader = SimpleDirectoryReader(input_files=[path])
+            docs = reader.load_data()
+            pbar.update()
+            pbar.set_description("🟢 Processing data")
+        return docs
+
+    def generate_documents(self, previous_hash: str = None) -> List["Document"]:
+        """Fetch and parse the source, recording its SHA-256 in `content_hash`.
+
+        If the hash equals `previous_hash` the document is unchanged and is
+        not parsed at all; an empty list is returned.
+        """
+        # Local files (and file objects backed by one) are read in place
+        name = getattr(self.file, "name", None)
+        if not self.path and isinstance(name, str) and os.path.isfile(name):
+            self.path = name
+        if self.path:
+            if not os.path.isfile(self.path):
+                raise FileNotFoundError(f"No such file: {self.path}")
+            self.content_hash = sha256_file(self.path)
+            if self.content_hash == previous_hash:
+                return []
+            return self.load_documents(path=self.path)
+
         with NamedTemporaryFile(
             suffix=self.get_datasource_suffix(), delete=True
         ) as temp_file:
             if self.url:
-                response = requests.get(self.url, stream=True)
-                total_size_in_bytes = int(response.headers.get("content-length", 0))
-                block_size = 1024
-                content = b""
-                with tqdm(
-                    total=total_size_in_bytes,
-                    desc="🟠 Downloading file",
-                    unit="iB",
-                    unit_scale=True,
-                ) as progress_bar:
-                    for data in response.iter_content(block_size):
-                        progress_bar.update(len(data))
-                        content += data
-                    if (
-                        total_size_in_bytes != 0
-                        and progress_bar.n != total_size_in_bytes
-                    ):
-                        print("ERROR, something went wrong")
-                    else:
-                        progress_bar.set_description("🟢 Downloading file")
+                from nagato.utils.download import download_to_file
+
+                with progress(
+                    desc="🟠 Downloading file", unit="iB", unit_scale=True
+                ) as progress_bar, metrics.timer("download"):
+                    self.content_hash = download_to_file(
+                        url=self.url,
+                        file=temp_file,
+                        checksum=self.checksum,
+                        callback=progress_bar.update,
+                    )
+                    progress_bar.set_description("🟢 Downloading file")
+            elif self.file is not None:
+                digest = hashlib.sha256()
+                for block in iter(lambda: self.file.read(1024 * 1024), b""):
+                    temp_file.write(block)
+                    digest.update(block)
+                self.content_hash = digest.hexdigest()
             else:
-                content = self.content
-            temp_file.write(content)
+                temp_file.write(self.content)
             temp_file.flush()
+            if self.content_hash == previous_hash:
+                return []
 
-            with tqdm(total=1, desc="🟠 Processing data") as pbar:
-                reader = SimpleDirectoryReader(input_files=[temp_file.name])
-                docs = reader.load_data()
-                pbar.update()
-                pbar.set_description("🟢 Processing data")
+            return self.load_documents(path=temp_file.name)
 
-            return docs
+    def generate_chunks(
+        self, documents: List["Document"]
+    ) -> List[Union["Document", None]]:
+        from llama_index.node_parser import SimpleNodeParser
 
-    def generate_chunks(self, documents: List[Document]) -> List[Union[Document, None]]:
         parser = SimpleNodeParser.from_defaults(chunk_size=350, chunk_overlap=20)
-        with tqdm(total=1, desc="🟠 Generating chunks") as pbar:
+        with progress(total=1, desc="🟠 Generating chunks") as pbar, metrics.timer(
+            "chunk", items=len(documents)
+        ):
             nodes = parser.get_nodes_from_documents(documents, show_progress=False)
             pbar.update()
             pbar.set_description("🟢 Generating chunks")
-        return nodes
+        # Content-addressed ids, so unchanged chunks keep their vector id and
+        # duplicate chunks within a document collapse into one
+        unique_nodes = {}
+        for node in nodes:
+            if node is not None:
+                node.id_ = chunk_id(source_key=self.source_key, text=node.text)
+                unique_nodes.setdefault(node.id_, node)
+        return list(unique_nodes.values())
 
     def generate_embeddings(
         self,
-        nodes: List[Union[Document, None]],
+        nodes: List[Union["Document", None]],
         filter_id: str,
         model: str = "all-MiniLM-L6-v2",
         embedding_provider: str = "PINECONE",
+        batch_size: int = 64,
+        sort_by_length: bool = True,
+        upsert_batch_size: int = 100,
+        max_in_flight: int = 4,
+        return_embeddings: bool = True,
+        use_cache: bool = True,
     ) -> List[ndarray]:
-        vectordb = get_vector_service(
-            provider=embedding_provider,
-            index_name=MODEL_TO_INDEX[model].get("index_name"),
-            filter_id=filter_id,
-            dimension=MODEL_TO_INDEX[model].get("dimensions"),
+        vectordb = get_model_vector_service(
+            model=model, provider=embedding_provider, filter_id=filter_id
         )
-        embedding_model = LazyModelLoader(model_name=model)
-        embeddings = []
-        with tqdm(total=len(nodes), desc="🟠 Generating embeddings") as pbar:
-            for node in nodes:
-                if node is not None:
+        nodes = [node for node in nodes if node is not None]
+        embeddings = [None] * len(nodes) if return_embeddings else []
+        pending = []
+        with progress(
+            total=len(nodes), desc="🟠 Generating embeddings"
+        ) as pbar, BoundedExecutor(max_in_flight=max_in_flight) as upserts:
+            for indices, vectors in iter_cached_batches(
+                model_name=model,
+                texts=[node.text for node in nodes],
+                cache=chunk_embedding_cache if use_cache else None,
+                batch_size=batch_size,
+                sort_by_length=sort_by_length,
+            ):
+                for index, vector in zip(indices, vectors):
+                    node = nodes[index]
                     embedding = (
                         node.id_,
-                        embedding_model.model.encode(node.text).tolist(),
+                        vector.tolist(),
                         {**node.metadata, "content": node.text},
                     )
-                    embeddings.append(embedding)
-                pbar.update()
-            vectordb.upsert(vectors=embeddings)
+                    pending.append(embedding)
+                    if return_embeddings:
+                        embeddings[index] = embedding
+                while len(pending) >= upsert_batch_size:
+                    upserts.submit(
+                        metrics.wrap(
+                            "upsert", vectordb.upsert, items=upsert_batch_size
+                        ),
+                        vectors=pending[:upsert_batch_size],
+                    )
+                    pending = pending[upsert_batch_size:]
+                pbar.update(len(indices))
+            if pending:
+                upserts.submit(
+                    metrics.wrap("upsert", vectordb.upsert, items=len(pending)),
+                    vectors=pending,
+                )
+            upserts.join()
             pbar.set_description("🟢 Generating embeddings")
 
         return embeddings
+
+    def delete_embeddings(
+        self,
+        ids: List[str],
+        filter_id: str,
+        model: str = "all-MiniLM-L6-v2",
+        embedding_provider: str = "PINECONE",
+    ) -> None:
+        vectordb = get_model_vector_service(
+            model=model, provider=embedding_provider, filter_id=filter_id
+        )
+        vectordb.delete(ids=ids)
+
+
+def iter_encoded_batches(
+    model,
+    texts: List[str],
+    batch_size: int = 64,
+    sort_by_length: bool = True,
+) -> Iterator[Tuple[List[int], ndarray]]:
+    """Encode `texts` batch by batch, yielding `(indices, vectors)` pairs.
+
+    `indices` are the positions in `texts` that the rows of `vectors` belong
+    to. With `sort_by_length` the texts are bucketed by length before
+    batching so each batch pads to a similar sequence length.
+    """
+    if sort_by_length:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    else:
+        order = list(range(len(texts)))
+    for batch in batched(order, batch_size):
+        with metrics.timer("encode", items=len(batch)):
+            vectors = model.encode(
+                [texts[i] for i in batch],
+                batch_size=batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+            )
+        yield batch, vectors
+
+
+def iter_cached_batches(
+    model_name: str,
+    texts: List[str],
+    cache: EmbeddingCache = None,
+    batch_size: int = 64,
+    sort_by_length: bool = True,
+    lookup_batch_size: int = 1000,
+) -> Iterator[Tuple[List[int], ndarray]]:
+    """Like `iter_encoded_batches`, but serve texts from `cache` when possible.
+
+    Cache lookups are batched ahead of encoding; cached vectors are yielded
+    first, and only the misses go through the model (which is not even
+    loaded when everything is cached). Newly encoded vectors are written
+    back to the cache.
+    """
+    if cache is None:
+        yield from iter_encoded_batches(
+            model=LazyModelLoader(model_name=model_name).model,
+            texts=texts,
+            batch_size=batch_size,
+            sort_by_length=sort_by_length,
+        )
+        return
+    missing = []
+    for positions in batched(range(len(texts)), lookup_batch_size):
+        found = cache.get_many(model=model_name, texts=[texts[i] for i in positions])
+        hits = [i for i, vector in zip(positions, found) if vector is not None]
+        missing.extend(i for i, vector in zip(positions, found) if vector is None)
+        if hits:
+            yield hits, np.vstack([vector for vector in found if vector is not None])
+    if not missing:
+        return
+    for indices, vectors in iter_encoded_batches(
+        model=LazyModelLoader(model_name=model_name).model,
+        texts=[texts[i] for i in missing],
+        batch_size=batch_size,
+        sort_by_length=sort_by_length,
+    ):
+        positions = [missing[i] for i in indices]
+        cache.put_many(
+            model=model_name, texts=[texts[i] for i in positions], vectors=vectors
+        )
+        yield positions, vectors
+
+
+def encode_texts(
+    model,
+    texts: List[str],
+    batch_size: int = 64,
+    sort_by_length: bool = True,
+) -> ndarray:
+    """Encode `texts` in batches and return one (len(texts), dim) matrix.
+
+    Rows are always returned in the original order of `texts`.
+    """
+    embeddings = None
+    for indices, vectors in iter_encoded_batches(
+        model=model, texts=texts, batch_size=batch_size, sort_by_length=sort_by_length
+    ):
+        if embeddings is None:
+            embeddings = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+        embeddings[indices] = vectors
+    if embeddings is None:
+        dimension = model.get_sentence_embedding_dimension()
+        embeddings = np.empty((0, dimension), dtype=np.float32)
+    return embeddings
+
+
+def embed_queries(queries: List[str], model_name: str) -> ndarray:
+    """Encode `queries` with `model_name`, skipping cached query vectors.
+
+    Only the queries missing from `query_embedding_cache` go through the
+    model, in a single batched forward pass.
+    """
+    vectors = query_embedding_cache.get_many(model=model_name, texts=queries)
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        encoded = encode_texts(
+            model=LazyModelLoader(model_name=model_name).model,
+            texts=[queries[i] for i in missing],
+        )
+        query_embedding_cache.put_many(
+            model=model_name, texts=[queries[i] for i in missing], vectors=encoded
+        )
+        for i, vector in zip(missing, encoded):
+            vectors[i] = vector
+    return np.vstack(vectors)
+
+
+async def aembed_queries(queries: List[str], model_name: str) -> ndarray:
+    return await run_in_executor(embed_queries, queries=queries, model_name=model_name)
@@ -1,23 +1,25 @@
 # flake8: noqa
 
 import sys
+import hashlib
 import requests
 import json
 import os
 import uuid
-import openai
-import replicate
 import concurrent.futures
 
-from tqdm import tqdm
 from decouple import config
 from abc import ABC, abstractmethod
-from typing import Dict, List, Union
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, TextIO, Union
 from concurrent.futures import ThreadPoolExecutor
 
+from nagato.utils.completion_cache import completion_cache, completion_key
+from nagato.utils.dedup import MinHashDeduplicator
 from nagato.utils.logger import logger
-from decouple import config
-from llama_index import Document
+from nagato.utils.metrics import metrics
+from nagato.utils.progress import progress
+from nagato.utils.rate_limit import TokenBucket, retry_with_backoff
+from nagato.utils.tokens import count_tokens
 
 from nagato.service.prompts import (
     GPT_DATA_FORMAT,
@@ -25,7 +27,8 @@ from nagato.service.prompts import (
     generate_qa_pair_prompt,
 )
 
-openai.api_key = config("OPENAI_API_KEY")
+if TYPE_CHECKING:
+    from llama_index import Document
 
 
 REPLICATE_MODELS = {
@@ -41,56 +44,261 @@ REPLICATE_MODELS = {
 
 OPENAI_MODELS = {"GPT_35_TURBO": "gpt-3.5-turbo"}
 
+# Rough completion size of one Q&A pair, used to pace requests against a
+# tokens-per-minute limit
+COMPLETION_TOKENS_PER_QA_PAIR = 80
+
+
+def truncate_incomplete_line(path: str, block_size: int = 65536) -> None:
+    """Cut a trailing line without a newline, left by a crash mid-write."""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            f.truncate(position)
+
 
 class FinetuningService(ABC):
     def __init__(
         self,
-        nodes: List[Union[Document, None]],
+        nodes: List[Union["Document", None]],
         num_questions_per_chunk: int,
         batch_size: int,
     ):
         self.nodes = nodes
         self.num_questions_per_chunk = num_questions_per_chunk
         self.batch_size = batch_size
+        requests_per_minute = config(
+            "NAGATO_LLM_REQUESTS_PER_MINUTE", default=0, cast=int
+        )
+        tokens_per_minute = config("NAGATO_LLM_TOKENS_PER_MINUTE", default=0, cast=int)
+        self.request_bucket = (
+            TokenBucket(rate_per_minute=requests_per_minute)
+            if requests_per_minute
+            else None
+        )
+        self.token_bucket = (
+            TokenBucket(rate_per_minute=tokens_per_minute)
+            if tokens_per_minute
+            else None
+        )
+        self.dedup_threshold = config(
+            "NAGATO_DEDUP_THRESHOLD", default=0.85, cast=float
+        )
+        self._validated_files = set()
+        self._reset_stats()
 
     @abstractmethod
     def generate_prompt_and_completion(self, node):
         pass
 
     @abstractmethod
-    def validate_dataset(self, training_file: str) -> str:
+    def validate_record(self, data: Dict) -> bool:
+        pass
+
+    @abstractmethod
+    def record_question(self, data: Dict) -> str:
         pass
 
     @abstractmethod
     def finetune(self, training_file: str, base_model: str) -> Dict:
         pass
 
-    def generate_dataset(self) -> str:
-        training_file = f"{uuid.uuid4()}.jsonl"
+    def chat_completion(self, prompt: str, model: str = "gpt-3.5-turbo") -> str:
+        """Answer `prompt` at temperature 0.
+
+        Completions are reused from `completion_cache`, so re-running on the
+        same corpus does not pay for Q&A generation again. Only cache misses
+        are paced by the NAGATO_LLM_REQUESTS_PER_MINUTE /
+        NAGATO_LLM_TOKENS_PER_MINUTE token buckets.
+        """
+        messages = [{"role": "user", "content": prompt}]
+        key = completion_key(
+            model=model, messages=messages, temperature=0, max_tokens=None
+        )
+        content = completion_cache.get(key)
+        if content is not None:
+            return content
+        if self.request_bucket:
+            self.request_bucket.acquire()
+        if self.token_bucket:
+            self.token_bucket.acquire(
+                count_tokens(prompt)
+                + self.num_questions_per_chunk * COMPLETION_TOKENS_PER_QA_PAIR
+            )
+        import openai
+
+        with metrics.timer("completion"):
+            completion = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=0,
+                api_key=config("OPENAI_API_KEY"),
+            )
+        content = completion.choices[0].message.content
+        completion_cache.put(key, content)
+        return content
+
+    def _generate_with_limits(self, node) -> str:
+        """`generate_prompt_and_completion`, retrying rate-limit and transient
+        errors with jittered backoff."""
+        return retry_with_backoff(lambda: self.generate_prompt_and_completion(node))
+
+    def _reset_stats(self) -> None:
+        self.stats = {"valid": 0, "invalid": 0, "duplicates": 0, "near_duplicates": 0}
+        self._seen = set()
+        self._near_duplicates = (
+            MinHashDeduplicator(threshold=self.dedup_threshold)
+            if self.dedup_threshold
+            else None
+        )
+
+    def parse_line(self, line: str) -> Optional[str]:
+        """Return `line` as normalized JSON if it is a valid training record."""
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(data, dict) or not self.validate_record(data):
+            return None
+        return json.dumps(data)
+
+    def write_records(self, lines: Iterable[str], f: TextIO) -> int:
+        """Validate and deduplicate `lines`, writing the accepted ones to `f`.
+
+        Records are dropped if they are invalid, exact duplicates, or (unless
+        NAGATO_DEDUP_THRESHOLD is 0) ask a question whose MinHash similarity
+        to an earlier question reaches the threshold. Updates the running
+        counts in `stats` and returns how many lines were looked at (blank
+        lines are skipped).
+        """
+        processed = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            processed += 1
+            record = self.parse_line(line)
+            if record is None:
+                self.stats["invalid"] += 1
+                continue
+            key = hashlib.sha1(record.encode()).digest()
+            if key in self._seen:
+                self.stats["duplicates"] += 1
+                continue
+            self._seen.add(key)
+            if self._near_duplicates is not None and self._near_duplicates.add(
+                self.record_question(json.loads(record))
+            ):
+                self.stats["near_duplicates"] += 1
+                continue
+            f.write(record + "\n")
+            self.stats["valid"] += 1
+        return processed
+
+    def generate_dataset(self, training_file: str = None) -> str:
+        """Generate Q&A pairs for every node into a JSONL `training_file`.
+
+        Up to `batch_size` completions are kept in flight at all times; a new
+        one is started as soon as any finishes. Requests are paced and cached
+        by `chat_completion`. Each completion is validated and deduplicated
+        as it arrives (see `write_records`), so the file only ever holds
+        valid records. Finished node ids are checkpointed next to the
+        training file, so calling this again with the same `training_file`
+        after a crash only generates the remaining nodes.
+        """
+        training_file = training_file or f"{uuid.uuid4()}.jsonl"
+        checkpoint_file = f"{training_file}.checkpoint"
+        finished = set()
+        self._reset_stats()
+        if os.path.exists(checkpoint_file) and os.path.exists(training_file):
+            with open(checkpoint_file, "r") as f:
+                finished = {line.strip() for line in f}
+            # The node being written when the crash happened is regenerated
+            truncate_incomplete_line(training_file)
+            with open(training_file, "r") as f:
+                for line in f:
+                    record = line.rstrip("\n")
+                    self._seen.add(hashlib.sha1(record.encode()).digest())
+                    if self._near_duplicates is not None:
+                        self._near_duplicates.add(
+                            self.record_question(json.loads(record))
+                        )
+                    self.stats["valid"] += 1
+        nodes = [
+            node for node in self.nodes if node is not None and node.id_ not in finished
+        ]
         total_pairs = len(self.nodes) * self.num_questions_per_chunk
-        with open(training_file, "w") as f:
-            with ThreadPoolExecutor() as executor:
-                progress_bar = tqdm(
-                    total=total_pairs,
-                    desc="🟠 Generating synthetic Q&A pairs",
-                    file=sys.stdout,
+        with open(training_file, "a" if finished else "w") as f, open(
+            checkpoint_file, "a" if finished else "w"
+        ) as checkpoint, ThreadPoolExecutor(max_workers=self.batch_size) as executor:
+            progress_bar = progress(
+                total=total_pairs,
+                initial=len(finished) * self.num_questions_per_chunk,
+                desc="🟠 Generating synthetic Q&A pairs",
+                file=sys.stdout,
+            )
+            remaining = iter(nodes)
+            in_flight = {}
+
+            def submit_next():
+                node = next(remaining, None)
+                if node is not None:
+                    in_flight[executor.submit(self._generate_with_limits, node)] = node
+
+            for _ in range(self.batch_size):
+                submit_next()
+            while in_flight:
+                done, _ = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
                 )
-                for i in range(
-                    0, len(self.nodes), self.batch_size
-                ):  # Process nodes in chunks of batch_size
-                    batch_nodes = self.nodes[i : i + self.batch_size]
-                    tasks = [
-                        executor.submit(self.generate_prompt_and_completion, node)
-                        for node in batch_nodes
-                    ]
-                    for future in concurrent.futures.as_completed(tasks):
-                        qa_pair = future.result()
-                        json_objects = qa_pair.split("\n\n")
-                        for json_obj in json_objects:
-                            f.write(json_obj + "\n")
-                            progress_bar.update(1)
-                progress_bar.set_description("🟢 Generating synthetic Q&A pairs")
-                progress_bar.close()
+                for future in done:
+                    node = in_flight.pop(future)
+                    qa_pair = future.result()
+                    progress_bar.update(
+                        self.write_records(lines=qa_pair.splitlines(), f=f)
+                    )
+                    progress_bar.set_postfix(
+                        valid=self.stats["valid"], invalid=self.stats["invalid"]
+                    )
+                    f.flush()
+                    checkpoint.write(node.id_ + "\n")
+                    checkpoint.flush()
+                    submit_next()
+            progress_bar.set_description("🟢 Generating synthetic Q&A pairs")
+            progress_bar.close()
+        os.remove(checkpoint_file)
+        self._validated_files.add(training_file)
+        logger.info(f"Generated dataset {training_file}: {self.stats}")
+        return training_file
+
+    def validate_dataset(self, training_file: str) -> str:
+        """Drop invalid and duplicate records from `training_file`.
+
+        Files written by `generate_dataset` are validated while they are
+        generated and returned as is. Other files are streamed through
+        `write_records` into a temporary file that replaces the original.
+        """
+        if training_file in self._validated_files:
+            return training_file
+        self._reset_stats()
+        temp_file = f"{training_file}.tmp"
+        with open(training_file, "r") as source, open(temp_file, "w") as f:
+            progress_bar = progress(desc="🟠 Validating dataset", file=sys.stdout)
+            for line in source:
+                progress_bar.update(self.write_records(lines=[line], f=f))
+            progress_bar.set_description("🟢 Validating dataset")
+            progress_bar.close()
+        os.replace(temp_file, training_file)
+        self._validated_files.add(training_file)
+        logger.info(f"Validated dataset {training_file}: {self.stats}")
         return training_file
 
     def cleanup(self, training_file: str) -> None:
@@ -100,7 +308,7 @@ class FinetuningService(ABC):
 class OpenAIFinetuningService(FinetuningService):
     def __init__(
         self,
-        nodes: List[Union[Document, None]],
+        nodes: List[Union["Document", None]],
         num_questions_per_chunk: int,
         batch_size: int,
         base_model: str = "GPT_35_TURBO",
@@ -118,51 +326,32 @@ class OpenAIFinetuningService(FinetuningService):
             num_of_qa_pairs=self.num_questions_per_chunk,
             format=GPT_DATA_FORMAT,
         )
-        completion = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
+        return self.chat_completion(prompt=prompt)
+
+    def validate_record(self, data: Dict) -> bool:
+        messages = data.get("messages")
+        return (
+            isinstance(messages, list)
+            and len(messages) == 3
+            and all(isinstance(message, dict) for message in messages)
+            and messages[0].get("role") == "system"
+            and messages[1].get("role") == "user"
+            and messages[2].get("role") == "assistant"
         )
-        return completion.choices[0].message.content
-
-    def validate_dataset(self, training_file: str) -> str:
-        valid_lines = []
-        with open(training_file, "r") as file:
-            lines = file.readlines()
-            total_lines = len(lines)
-            progress_bar = tqdm(
-                total=total_lines, desc="🟠 Validating dataset", file=sys.stdout
-            )
-            for line in lines:
-                try:
-                    data = json.loads(line)
-                    if "messages" not in data:
-                        continue
-                    messages = data["messages"]
-                    if len(messages) != 3:
-                        continue
-                    if not (
-                        messages[0]["role"] == "system"
-                        and messages[1]["role"] == "user"
-                        and messages[2]["role"] == "assistant"
-                    ):
-                        continue
-                    valid_lines.append(line)
-                except json.JSONDecodeError:
-                    continue
-                finally:
-                    progress_bar.update(1)
-            progress_bar.set_description("🟢 Validating dataset")
-            progress_bar.close()
 
-        with open(training_file, "w") as file:
-            file.writelines(valid_lines)
-        return training_file
+    def record_question(self, data: Dict) -> str:
+        return str(data["messages"][1].get("content", ""))
 
     def finetune(self, training_file: str, webhook_url: str = None) -> Dict:
-        file = openai.File.create(file=open(training_file, "rb"), purpose="fine-tune")
+        import openai
+
+        api_key = config("OPENAI_API_KEY")
+        with open(training_file, "rb") as f:
+            file = openai.File.create(file=f, purpose="fine-tune", api_key=api_key)
         finetune = openai.FineTuningJob.create(
-            training_file=file.get("id"), model=OPENAI_MODELS[self.base_model]
+            training_file=file.get("id"),
+            model=OPENAI_MODELS[self.base_model],
+            api_key=api_key,
         )
         return {**finetune, "training_file": training_file}
 
@@ -170,7 +359,7 @@ class OpenAIFinetuningService(FinetuningService):
 class ReplicateFinetuningService(FinetuningService):
     def __init__(
         self,
-        nodes: List[Union[Document, None]],
+        nodes: List[Union["Document", None]],
         num_questions_per_chunk: int,
         batch_size: int,
         base_model: str = "LLAMA2_7B_CHAT",
@@ -188,41 +377,17 @@ class ReplicateFinetuningService(FinetuningService):
             num_of_qa_pairs=self.num_questions_per_chunk,
             format=REPLICATE_FORMAT,
         )
-        completion = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        return completion.choices[0].message.content
-
-    def validate_dataset(self, training_file: str) -> str:
-        valid_data = []
-        with open(training_file, "r") as f:
-            lines = f.readlines()
-            total_lines = len(lines)
-            progress_bar = tqdm(
-                total=total_lines,
-                desc="🟠 Validating training data",
-                file=sys.stdout,
-            )
-            for i, line in enumerate(lines, start=1):
-                try:
-                    data = json.loads(line)
-                    if "prompt" in data and "completion" in data:
-                        valid_data.append(data)
-                except json.JSONDecodeError:
-                    pass
-                progress_bar.update(1)
-            progress_bar.set_description("🟢 Validating training data")
-            progress_bar.close()
+        return self.chat_completion(prompt=prompt)
 
-        with open(training_file, "w") as f:
-            for data in valid_data:
-                f.write(json.dumps(data) + "\n")
+    def validate_record(self, data: Dict) -> bool:
+        return "prompt" in data and "completion" in data
 
-        return training_file
+    def record_question(self, data: Dict) -> str:
+        return str(data["prompt"])
 
     def finetune(self, training_file: str, webhook_url: str = None) -> Dict:
+        import replicate
+
         training_file_url = upload_replicate_dataset(training_file=training_file)
         training = replicate.Client(
             api_token=config("REPLICATE_API_KEY")
@@ -235,7 +400,7 @@ class ReplicateFinetuningService(FinetuningService):
             destination="homanp/test",
             webhook=webhook_url,
         )
-        progress_bar = tqdm(
+        progress_bar = progress(
             total=1,
             desc="🟢 Started model training",
             file=sys.stdout,
@@ -246,7 +411,7 @@ class ReplicateFinetuningService(FinetuningService):
 
 
 def get_finetuning_service(
-    nodes: List[Union[Document, None]],
+    nodes: List[Union["Document", None]],
     provider: str = "openai",
     base_model: str = "GPT_35_TURBO",
     num_questions_per_chunk: int = 10,
@@ -0,0 +1,259 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List
+
+from decouple import config
+
+from nagato.service.embedding import EmbeddingService, model_index
+from nagato.service.lexical import index_nodes
+from nagato.utils.manifest import IngestionManifest, manifest_enabled
+
+
+def source_embedding_service(source: Dict) -> EmbeddingService:
+    return EmbeddingService(
+        type=source["type"],
+        url=source.get("url"),
+        content=source.get("content"),
+        path=source.get("path"),
+        checksum=source.get("checksum"),
+        document_id=source.get("document_id"),
+    )
+
+
+def parse_and_chunk(source: Dict, previous_hash: str = None) -> Dict:
+    """Download/read, parse and chunk one source. Runs in a worker process.
+
+    Returns the source key, content hash and chunks of the source; `nodes`
+    is None if its content hash equals `previous_hash`.
+    """
+    embedding_service = source_embedding_service(source)
+    documents = embedding_service.generate_documents(previous_hash=previous_hash)
+    nodes = None
+    if previous_hash is None or embedding_service.content_hash != previous_hash:
+        nodes = embedding_service.generate_chunks(documents=documents)
+    return {
+        "source_key": embedding_service.source_key,
+        "content_hash": embedding_service.content_hash,
+        "nodes": nodes,
+    }
+
+
+class BatchedEmbedder:
+    """Collects chunks from many documents and embeds them in large batches.
+
+    Documents are buffered until `flush_size` chunks are pending. A flush
+    embeds and upserts each `filter_id` group with one `generate_embeddings`
+    call, so many small documents share encoder batches and upserts. With
+    `manifests` (one `IngestionManifest` per `filter_id`), a flushed group's
+    stale chunks are deleted and its documents recorded in one save. With
+    `lexical_index`, flushed chunks are kept until `close`, which adds them
+    to each `filter_id`'s BM25 index in one save (rewriting the index on
+    every flush would make bulk ingestion quadratic); the manifest is then
+    only saved after the BM25 index, so it never lists documents missing
+    from it.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        embedding_provider: str = "PINECONE",
+        flush_size: int = 512,
+        lexical_index: bool = False,
+        manifests: Dict[str, IngestionManifest] = None,
+    ):
+        self.model = model
+        self.embedding_provider = embedding_provider
+        self.flush_size = flush_size
+        self.lexical_index = lexical_index
+        self.manifests = manifests
+        self._pending: List[Dict] = []
+        self._num_pending = 0
+        self._lexical: Dict[str, Dict] = {}
+
+    def add(self, status: Dict, nodes: List, record: Dict = None) -> None:
+        """Queue `nodes` for the document whose status dict is `status`.
+
+        `record` holds the `source_key`, `content_hash`, `chunk_ids` and
+        `stale_ids` to apply to the manifest once the nodes are stored.
+        """
+        self._pending.append({"status": status, "nodes": nodes, "record": record})
+        self._num_pending += len(nodes)
+        if self._num_pending >= self.flush_size:
+            self.flush()
+
+    def flush(self) -> None:
+        pending, self._pending, self._num_pending = self._pending, [], 0
+        groups: Dict[str, List[Dict]] = {}
+        for item in pending:
+            groups.setdefault(item["status"]["filter_id"], []).append(item)
+        for filter_id, items in groups.items():
+            nodes = [node for item in items for node in item["nodes"]]
+            records = [item["record"] for item in items if item["record"]]
+            stale_ids = {id_ for record in records for id_ in record["stale_ids"]}
+            try:
+                embedding_service = EmbeddingService(type=None)
+                embedding_service.generate_embeddings(
+                    nodes=nodes,
+                    filter_id=filter_id,
+                    model=self.model,
+                    embedding_provider=self.embedding_provider,
+                    return_embeddings=False,
+                )
+                if stale_ids:
+                    embedding_service.delete_embeddings(
+                        ids=list(stale_ids),
+                        filter_id=filter_id,
+                        model=self.model,
+                        embedding_provider=self.embedding_provider,
+                    )
+                if self.lexical_index:
+                    group = self._lexical.setdefault(
+                        filter_id, {"nodes": [], "stale_ids": set(), "items": []}
+                    )
+                    group["nodes"].extend(nodes)
+                    group["stale_ids"].update(stale_ids)
+                    group["items"].extend(items)
+                    continue
+                self._record(filter_id=filter_id, records=records)
+                for item in items:
+                    item["status"]["status"] = "SUCCESS"
+            except Exception as error:
+                for item in items:
+                    item["status"].update(status="FAILED", error=str(error))
+
+    def close(self) -> None:
+        """Flush, then write the BM25 index and manifest of every `filter_id`
+        whose chunks were kept for the lexical index."""
+        self.flush()
+        lexical, self._lexical = self._lexical, {}
+        for filter_id, group in lexical.items():
+            try:
+                index_nodes(
+                    nodes=group["nodes"],
+                    filter_id=filter_id,
+                    stale_ids=group["stale_ids"],
+                )
+                self._record(
+                    filter_id=filter_id,
+                    records=[
+                        item["record"] for item in group["items"] if item["record"]
+                    ],
+                )
+                for item in group["items"]:
+                    item["status"]["status"] = "SUCCESS"
+            except Exception as error:
+                for item in group["items"]:
+                    item["status"].update(status="FAILED", error=str(error))
+
+    def _record(self, filter_id: str, records: List[Dict]) -> None:
+        if self.manifests is None or not records:
+            return
+        manifest = self.manifests[filter_id]
+        for record in records:
+            manifest.set(
+                source_key=record["source_key"],
+                content_hash=record["content_hash"],
+                chunk_ids=record["chunk_ids"],
+            )
+        manifest.save()
+
+
+def create_vector_embeddings_bulk(
+    sources: List[Dict],
+    model: str,
+    embedding_provider: str = "PINECONE",
+    max_workers: int = None,
+    flush_size: int = 512,
+    lexical_index: bool = None,
+    incremental: bool = False,
+) -> List[Dict]:
+    """Ingest many documents, parsing and chunking them in a process pool.
+
+    Each source is a dict with `type`, `filter_id` and one of `url`,
+    `content` or `path` (plus an optional `checksum` and `document_id`).
+    While workers parse, the main process embeds finished documents through
+    a shared `BatchedEmbedder`. Returns one status dict per source, in input
+    order; unchanged documents skipped by `incremental` are "SKIPPED".
+    `lexical_index`, `incremental` and the manifest bookkeeping are as in
+    `create_vector_embeddings`.
+    """
+    if lexical_index is None:
+        lexical_index = config("NAGATO_LEXICAL_INDEX", default=False, cast=bool)
+    manifests = None
+    if manifest_enabled(incremental=incremental):
+        manifests = {
+            filter_id: IngestionManifest(
+                filter_id=filter_id,
+                index_name=model_index(model)["index_name"],
+                provider=embedding_provider,
+            )
+            for filter_id in {source["filter_id"] for source in sources}
+        }
+    statuses = [
+        {
+            "source": source.get("url") or source.get("path"),
+            "filter_id": source["filter_id"],
+            "status": "PENDING",
+            "num_chunks": 0,
+            "error": None,
+        }
+        for source in sources
+    ]
+    embedder = BatchedEmbedder(
+        model=model,
+        embedding_provider=embedding_provider,
+        flush_size=flush_size,
+        lexical_index=lexical_index,
+        manifests=manifests,
+    )
+    previous = [
+        (
+            manifests[source["filter_id"]].get(
+                source_embedding_service(source).source_key
+            )
+            if manifests is not None
+            else None
+        )
+        or {}
+        for source in sources
+    ]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(
+                parse_and_chunk,
+                source,
+                previous_hash=entry.get("hash") if incremental else None,
+            ): (status, entry)
+            for source, status, entry in zip(sources, statuses, previous)
+        }
+        for future in as_completed(futures):
+            status, entry = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                status.update(status="FAILED", error=str(error))
+                continue
+            if result["nodes"] is None:
+                status["status"] = "SKIPPED"
+                continue
+            nodes = [node for node in result["nodes"] if node is not None]
+            chunk_ids = [node.id_ for node in nodes]
+            previous_ids = set(entry.get("chunks", []))
+            if incremental:
+                nodes = [node for node in nodes if node.id_ not in previous_ids]
+            status["num_chunks"] = len(nodes)
+            embedder.add(
+                status=status,
+                nodes=nodes,
+                record=(
+                    {
+                        "source_key": result["source_key"],
+                        "content_hash": result["content_hash"],
+                        "chunk_ids": chunk_ids,
+                        "stale_ids": previous_ids.difference(chunk_ids),
+                    }
+                    if manifests is not None
+                    else None
+                ),
+            )
+    embedder.close()
+    return statuses
@@ -0,0 +1,72 @@
+import os
+import threading
+from typing import Dict, Iterable, List
+
+from decouple import config
+
+from nagato.service.rerank import as_match
+from nagato.utils.bm25 import BM25Index
+from nagato.utils.manifest import file_lock
+
+_index_lock = threading.Lock()
+_indexes: Dict[str, BM25Index] = {}
+
+
+def get_lexical_index(filter_id: str = None) -> BM25Index:
+    """Shared BM25 index of `filter_id`, under NAGATO_LEXICAL_INDEX_PATH.
+
+    Indexes saved by another process since the last call are reloaded.
+    """
+    path = os.path.join(
+        config("NAGATO_LEXICAL_INDEX_PATH", default=".nagato/bm25"),
+        filter_id or "__default__",
+    )
+    with _index_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = BM25Index(path=path)
+    index.reload_if_changed()
+    return index
+
+
+def clear_lexical_index_cache() -> None:
+    with _index_lock:
+        _indexes.clear()
+
+
+def index_nodes(nodes: List, filter_id: str, stale_ids: Iterable[str] = ()) -> None:
+    """Add `nodes` to the BM25 index of `filter_id`, drop `stale_ids`, and save.
+
+    Rows carry the same metadata as the chunk's vector, so lexical matches
+    can be reranked and packed into prompts like vector matches. The index is
+    reloaded, updated and saved under a file lock, so concurrent writers to
+    the same `filter_id` keep each other's chunks.
+    """
+    index = get_lexical_index(filter_id=filter_id)
+    os.makedirs(os.path.dirname(index.path) or ".", exist_ok=True)
+    with file_lock(f"{index.path}.lock"):
+        index.reload_if_changed()
+        index.delete(ids=list(stale_ids))
+        nodes = [node for node in nodes if node is not None]
+        index.add(
+            ids=[node.id_ for node in nodes],
+            texts=[node.text for node in nodes],
+            metadata=[{**node.metadata, "content": node.text} for node in nodes],
+        )
+        index.save()
+
+
+def reciprocal_rank_fusion(results: List[List], top_k: int, k: int = 60) -> List:
+    """Fuse ranked match lists into one, scoring each id by the sum of
+    1 / (k + rank) over the lists it appears in (RRF).
+
+    Matches may be dicts or Pinecone `ScoredVector`s; fused matches are dicts.
+    """
+    fused: Dict[str, dict] = {}
+    scores: Dict[str, float] = {}
+    for matches in results:
+        for rank, match in enumerate(matches, start=1):
+            fused.setdefault(match["id"], as_match(match))
+            scores[match["id"]] = scores.get(match["id"], 0.0) + 1.0 / (k + rank)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k]
+    return [{**fused[id_], "score": scores[id_]} for id_ in ranked]
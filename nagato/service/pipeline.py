@@ -0,0 +1,200 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Union
+
+from nagato.service.embedding import (
+    embed_queries,
+    get_model_vector_service,
+    model_index,
+)
+from nagato.service.lexical import get_lexical_index, reciprocal_rank_fusion
+from nagato.service.query import QueryService
+from nagato.service.rerank import get_rerank_service
+from nagato.service.semantic_cache import (
+    SemanticAnswerCache,
+    cached_predict_with_embedding,
+)
+from nagato.utils.metrics import metrics
+from nagato.utils.timing import StageTimer
+
+
+def merge_matches(results: List[List], top_k: int) -> List:
+    """Merge per-namespace matches into one list ordered by score."""
+    merged = {}
+    for matches in results:
+        for match in matches:
+            if (
+                match["id"] not in merged
+                or match["score"] > merged[match["id"]]["score"]
+            ):
+                merged[match["id"]] = match
+    return sorted(merged.values(), key=lambda match: match["score"], reverse=True)[
+        :top_k
+    ]
+
+
+def hedged_rerank(
+    executor: ThreadPoolExecutor,
+    query: str,
+    documents: List,
+    top_n: int,
+    provider: str = None,
+    hedge_after: float = None,
+) -> List[dict]:
+    """Rerank, issuing a duplicate request if the first is slower than
+    `hedge_after` seconds, and return whichever answers first."""
+    reranker = get_rerank_service(provider=provider)
+    futures = [
+        executor.submit(reranker.rerank, query=query, documents=documents, top_n=top_n)
+    ]
+    if hedge_after is not None:
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done:
+            futures.append(
+                executor.submit(
+                    reranker.rerank, query=query, documents=documents, top_n=top_n
+                )
+            )
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None or not pending:
+                return future.result()
+
+
+def pipelined_predict_with_embedding(
+    input: str,
+    provider: str,
+    model: str,
+    vector_db: str,
+    embedding_model: str,
+    embedding_filter_id: Union[str, List[str]],
+    callback: Callable = None,
+    system_prompt: str = "You are a helpful assistant",
+    enable_streaming: bool = False,
+    top_k: int = 5,
+    re_rank: bool = True,
+    rerank_provider: str = None,
+    rerank_hedge_after: float = None,
+    on_timings: Callable[[Dict[str, float]], None] = None,
+    semantic_cache: bool = False,
+    max_tokens: int = 2000,
+    hybrid: bool = False,
+) -> dict:
+    """`predict_with_embedding` with its independent stages overlapped.
+
+    Query encoding, vector service setup for every namespace and reranker
+    warm-up start together. Each namespace is queried as soon as both the
+    query vector and its connection are ready, and the merged candidates
+    are reranked (optionally hedged). The per-stage latency breakdown,
+    including time-to-first-token when streaming, is passed to
+    `on_timings`. `semantic_cache` reuses answers as in
+    `predict_with_embedding`. With `hybrid`, BM25 searches of every
+    namespace run alongside query encoding and their matches are fused
+    (RRF) with the vector matches before reranking.
+    """
+    timer = StageTimer()
+    filter_ids = (
+        [embedding_filter_id]
+        if isinstance(embedding_filter_id, str) or embedding_filter_id is None
+        else embedding_filter_id
+    )
+    index = model_index(embedding_model)
+    model_name = index["index_name"]
+    # Not used as a context manager: a hedged rerank that lost the race, or a
+    # slow warm-up, must not hold up the response.
+    executor = ThreadPoolExecutor(
+        max_workers=len(filter_ids) * (2 if hybrid else 1) + 3
+    )
+    try:
+        embedding = executor.submit(
+            embed_queries, queries=[input], model_name=model_name
+        )
+        services = [
+            executor.submit(
+                get_model_vector_service,
+                model=embedding_model,
+                provider=vector_db,
+                filter_id=filter_id,
+            )
+            for filter_id in filter_ids
+        ]
+        lexical = [
+            executor.submit(
+                lambda filter_id: get_lexical_index(filter_id=filter_id).search(
+                    query=input, top_k=top_k
+                ),
+                filter_id,
+            )
+            for filter_id in (filter_ids if hybrid else [])
+        ]
+        if re_rank:
+            executor.submit(get_rerank_service(provider=rerank_provider).warmup)
+        query_service = QueryService(provider=provider, model=model)
+
+        with timer.stage("encode"):
+            vector = embedding.result().tolist()
+        with timer.stage("query"), metrics.timer("query"):
+            results = [
+                executor.submit(
+                    lambda service: service.result().query(
+                        queries=vector, top_k=top_k, include_metadata=True
+                    ),
+                    service,
+                )
+                for service in services
+            ]
+            docs = merge_matches([result.result() for result in results], top_k=top_k)
+        if hybrid:
+            with timer.stage("lexical"), metrics.timer("lexical"):
+                docs = reciprocal_rank_fusion(
+                    [docs] + [result.result() for result in lexical], top_k=top_k
+                )
+        if re_rank:
+            with timer.stage("rerank"), metrics.timer("rerank", items=len(docs)):
+                docs = hedged_rerank(
+                    executor=executor,
+                    query=input,
+                    documents=docs,
+                    top_n=top_k,
+                    provider=rerank_provider,
+                    hedge_after=rerank_hedge_after,
+                )
+    finally:
+        executor.shutdown(wait=False)
+
+    def timed_callback(chunk):
+        timer.mark("first_token")
+        callback(chunk)
+
+    with timer.stage("completion"):
+        if semantic_cache:
+            output = cached_predict_with_embedding(
+                cache=SemanticAnswerCache(
+                    index_name=model_name,
+                    dimension=index["dimensions"],
+                    filter_id=",".join(
+                        filter_id or "__default__" for filter_id in filter_ids
+                    ),
+                ),
+                query_service=query_service,
+                embedding=vector[0],
+                input=input,
+                context=docs,
+                system_prompt=system_prompt,
+                enable_streaming=enable_streaming,
+                callback=timed_callback if enable_streaming else callback,
+                max_tokens=max_tokens,
+            )
+        else:
+            output = query_service.predict_with_embedding(
+                input=input,
+                callback=timed_callback if enable_streaming else callback,
+                enable_streaming=enable_streaming,
+                context=docs,
+                system_prompt=system_prompt,
+                max_tokens=max_tokens,
+            )
+    if on_timings:
+        on_timings(timer.total())
+    return output
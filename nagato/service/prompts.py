@@ -1,5 +1,7 @@
 # flake8: noqa
 
+from typing import List, Union
+
 GPT_DATA_FORMAT = (
     "{"
     '"messages": ['
@@ -18,13 +20,15 @@ REPLICATE_FORMAT = (
 )
 
 
-def generate_rag_prompt(context: str, input: str) -> str:
+def generate_rag_prompt(context: Union[str, List[str]], input: str) -> str:
+    if not isinstance(context, str):
+        context = "\n\n".join(context)
     prompt = (
         "You are an assistant for question-answering tasks. Use the following pieces"
         "of retrieved context to answer the question. If you don't know the answer, "
         "just say that you don't know. Use three sentences maximum and keep the answer concise.\n\n"
         f"Question: {input}\n"
-        f"Context: {context}"
+        f"Context: {context}\n"
         f"Answer:"
     )
     return prompt
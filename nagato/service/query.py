@@ -1,12 +1,27 @@
+import json
+import time
 from abc import ABC
-from typing import Callable
+from typing import Callable, List, Optional, Union
 
 import litellm
 from decouple import config
+from openai.util import convert_to_openai_object
 
+from nagato.service.context import build_context
 from nagato.service.prompts import (
     generate_rag_prompt,
 )
+from nagato.utils.completion_cache import (
+    completion_cache,
+    completion_key,
+    is_cacheable,
+)
+from nagato.utils.aio import run_in_executor
+from nagato.utils.metrics import metrics
+from nagato.utils.tokens import count_tokens, get_context_window
+
+# Tokens reserved for the chat message framing around system and user prompt
+MESSAGE_OVERHEAD_TOKENS = 16
 
 
 class QueryService(ABC):
@@ -24,35 +39,174 @@ class QueryService(ABC):
         else:
             self.api_key = None
 
-    def predict_with_embedding(
+    def _rag_messages(
         self,
         input: str,
-        context: str,
+        context: Union[str, List],
         system_prompt: str,
-        enable_streaming: bool = False,
-        callback: Callable = None,
+        max_tokens: int = 2000,
+    ) -> List:
+        """Messages for a RAG completion, with `context` packed into whatever
+        the model's context window leaves after the prompt and `max_tokens`."""
+        budget = (
+            get_context_window(self.model)
+            - max_tokens
+            - count_tokens(system_prompt or "", model=self.model)
+            - count_tokens(
+                generate_rag_prompt(context="", input=input), model=self.model
+            )
+            - MESSAGE_OVERHEAD_TOKENS
+        )
+        prompt = generate_rag_prompt(
+            context=build_context(
+                documents=context, model=self.model, max_tokens=max(budget, 0)
+            ),
+            input=input,
+        )
+        return [
+            {
+                "content": system_prompt,
+                "role": "system",
+            },
+            {
+                "content": prompt,
+                "role": "user",
+            },
+        ]
+
+    def _messages(self, input: str, system_prompt: str) -> List:
+        return [
+            {"content": system_prompt, "role": "system"},
+            {"content": input, "role": "user"},
+        ]
+
+    def _completion_key(
+        self, messages: List, max_tokens: int, temperature: float, stream: bool
+    ) -> Optional[str]:
+        """`completion_cache` key of the call, or None if it is uncacheable."""
+        if not is_cacheable(temperature=temperature, stream=stream):
+            return None
+        return completion_key(
+            model=self.model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+
+    def _completion(
+        self,
+        messages: List,
+        max_tokens: int,
+        temperature: float = 0,
+        stream: bool = False,
     ):
+        """`litellm.completion`, served from `completion_cache` when the call
+        is deterministic (temperature 0, not streamed)."""
+        key = self._completion_key(
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=stream,
+        )
+        cached = completion_cache.get(key) if key is not None else None
+        if cached is not None:
+            return convert_to_openai_object(cached)
         litellm.api_key = self.api_key
-        prompt = generate_rag_prompt(context=context, input=input)
+        started = time.perf_counter()
         output = litellm.completion(
             model=self.model,
-            messages=[
-                {
-                    "content": system_prompt,
-                    "role": "system",
-                },
-                {
-                    "content": prompt,
-                    "role": "user",
-                },
-            ],
-            max_tokens=2000,
-            temperature=0,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=stream,
+        )
+        if not stream:
+            metrics.observe("completion", time.perf_counter() - started)
+        if key is not None:
+            completion_cache.put(key, json.loads(json.dumps(output)))
+        return output
+
+    async def _acompletion(
+        self,
+        messages: List,
+        max_tokens: int,
+        temperature: float = 0,
+        stream: bool = False,
+    ):
+        """`_completion` on the event loop; `completion_cache` reads and writes
+        go to the disk store, so they run on the retrieval pool."""
+        key = self._completion_key(
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=stream,
+        )
+        cached = (
+            await run_in_executor(completion_cache.get, key)
+            if key is not None
+            else None
+        )
+        if cached is not None:
+            return convert_to_openai_object(cached)
+        started = time.perf_counter()
+        output = await litellm.acompletion(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=stream,
+            api_key=self.api_key,
+        )
+        if not stream:
+            metrics.observe("completion", time.perf_counter() - started)
+        if key is not None:
+            await run_in_executor(
+                completion_cache.put, key, json.loads(json.dumps(output))
+            )
+        return output
+
+    def _stream(self, output, callback: Callable, started: float) -> None:
+        """Pass streamed content to `callback`, recording time-to-first-token
+        and the time until the stream ends."""
+        first_token = True
+        for chunk in output:
+            if first_token:
+                metrics.observe("first_token", time.perf_counter() - started)
+                first_token = False
+            callback(chunk["choices"][0]["delta"]["content"])
+        metrics.observe("completion", time.perf_counter() - started)
+
+    async def _astream(self, output, callback: Callable, started: float) -> None:
+        first_token = True
+        async for chunk in output:
+            if first_token:
+                metrics.observe("first_token", time.perf_counter() - started)
+                first_token = False
+            callback(chunk["choices"][0]["delta"]["content"])
+        metrics.observe("completion", time.perf_counter() - started)
+
+    def predict_with_embedding(
+        self,
+        input: str,
+        context: Union[str, List],
+        system_prompt: str,
+        enable_streaming: bool = False,
+        callback: Callable = None,
+        max_tokens: int = 2000,
+    ):
+        started = time.perf_counter()
+        output = self._completion(
+            messages=self._rag_messages(
+                input=input,
+                context=context,
+                system_prompt=system_prompt,
+                max_tokens=max_tokens,
+            ),
+            max_tokens=max_tokens,
             stream=enable_streaming,
         )
         if enable_streaming:
-            for chunk in output:
-                callback(chunk["choices"][0]["delta"]["content"])
+            self._stream(output=output, callback=callback, started=started)
         return output
 
     def predict(
@@ -62,19 +216,53 @@ class QueryService(ABC):
         system_prompt: str = None,
         callback: Callable = None,
     ):
-        litellm.api_key = self.api_key
+        started = time.perf_counter()
+        output = self._completion(
+            messages=self._messages(input=input, system_prompt=system_prompt),
+            max_tokens=450,
+            stream=enable_streaming,
+        )
+        if enable_streaming:
+            self._stream(output=output, callback=callback, started=started)
+        return output
 
-        output = litellm.completion(
-            model=self.model,
-            messages=[
-                {"content": system_prompt, "role": "system"},
-                {"content": input, "role": "user"},
-            ],
+    async def apredict_with_embedding(
+        self,
+        input: str,
+        context: Union[str, List],
+        system_prompt: str,
+        enable_streaming: bool = False,
+        callback: Callable = None,
+        max_tokens: int = 2000,
+    ):
+        started = time.perf_counter()
+        output = await self._acompletion(
+            messages=self._rag_messages(
+                input=input,
+                context=context,
+                system_prompt=system_prompt,
+                max_tokens=max_tokens,
+            ),
+            max_tokens=max_tokens,
+            stream=enable_streaming,
+        )
+        if enable_streaming:
+            await self._astream(output=output, callback=callback, started=started)
+        return output
+
+    async def apredict(
+        self,
+        input: str,
+        enable_streaming: bool = False,
+        system_prompt: str = None,
+        callback: Callable = None,
+    ):
+        started = time.perf_counter()
+        output = await self._acompletion(
+            messages=self._messages(input=input, system_prompt=system_prompt),
             max_tokens=450,
-            temperature=0,
             stream=enable_streaming,
         )
         if enable_streaming:
-            for chunk in output:
-                callback(chunk["choices"][0]["delta"]["content"])
+            await self._astream(output=output, callback=callback, started=started)
         return output
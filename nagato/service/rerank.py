@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from decouple import config
+
+from nagato.utils.aio import run_in_executor
+from nagato.utils.batching import map_concurrent
+from nagato.utils.model_registry import model_registry
+
+
+def as_match(match: Any) -> Dict:
+    """`match` (a dict or a Pinecone `ScoredVector`) as a plain match dict."""
+    return {"id": match["id"], "score": match["score"], "metadata": match["metadata"]}
+
+
+def format_document(doc: Any) -> str:
+    return (
+        f"{doc['metadata']['content']}\n\n"
+        f"page number: {doc['metadata'].get('page_label')}"
+    )
+
+
+class RerankService(ABC):
+    @abstractmethod
+    def rerank(self, query: str, documents: list, top_n: int = 3) -> List[Dict]:
+        pass
+
+    def rerank_many(
+        self,
+        queries: List[str],
+        documents: List[list],
+        top_n: int = 3,
+        max_concurrency: int = 8,
+    ) -> List[List[Dict]]:
+        """Rerank `documents[i]` for `queries[i]`, returning one list per query.
+
+        Queries are reranked as separate requests, at most `max_concurrency`
+        at a time.
+        """
+        return map_concurrent(
+            lambda pair: (
+                self.rerank(query=pair[0], documents=pair[1], top_n=top_n)
+                if pair[1]
+                else []
+            ),
+            zip(queries, documents),
+            max_workers=max_concurrency,
+        )
+
+    async def arerank(self, query: str, documents: list, top_n: int = 3) -> List[Dict]:
+        return await run_in_executor(
+            self.rerank, query=query, documents=documents, top_n=top_n
+        )
+
+    def warmup(self) -> None:
+        """Load models or open connections ahead of the first `rerank`."""
+
+
+@lru_cache(maxsize=None)
+def get_cohere_client(api_key: str):
+    from cohere import Client
+
+    return Client(api_key=api_key)
+
+
+# AsyncClient sessions are bound to the loop that created them
+_async_cohere_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_cohere_client(api_key: str):
+    from cohere import AsyncClient
+
+    clients = _async_cohere_clients.setdefault(asyncio.get_running_loop(), {})
+    if api_key not in clients:
+        clients[api_key] = AsyncClient(api_key=api_key)
+    return clients[api_key]
+
+
+class CohereRerankService(RerankService):
+    def __init__(self, model: str = "rerank-multilingual-v2.0"):
+        self.model = model
+
+    def warmup(self) -> None:
+        get_cohere_client(api_key=config("COHERE_API_KEY"))
+
+    def rerank(self, query: str, documents: list, top_n: int = 3) -> List[Dict]:
+        api_key = config("COHERE_API_KEY")
+        if not api_key:
+            raise ValueError("API key for Cohere is not present.")
+        matches = [as_match(doc) for doc in documents]
+        re_ranked = (
+            get_cohere_client(api_key=api_key)
+            .rerank(
+                model=self.model,
+                query=query,
+                documents=[format_document(match) for match in matches],
+                top_n=top_n,
+            )
+            .results
+        )
+        return [
+            {**matches[obj.index], "score": obj.relevance_score} for obj in re_ranked
+        ]
+
+    async def arerank(self, query: str, documents: list, top_n: int = 3) -> List[Dict]:
+        api_key = config("COHERE_API_KEY")
+        if not api_key:
+            raise ValueError("API key for Cohere is not present.")
+        matches = [as_match(doc) for doc in documents]
+        re_ranked = (
+            await get_async_cohere_client(api_key=api_key).rerank(
+                model=self.model,
+                query=query,
+                documents=[format_document(match) for match in matches],
+                top_n=top_n,
+            )
+        ).results
+        return [
+            {**matches[obj.index], "score": obj.relevance_score} for obj in re_ranked
+        ]
+
+
+def load_cross_encoder(model_name: str):
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(model_name)
+
+
+class CrossEncoderRerankService(RerankService):
+    """Local reranker scoring (query, document) pairs with a cross-encoder.
+
+    The model is loaded once through the shared model registry. Pairs are
+    scored in batches, and scores are kept in an LRU cache, so repeated
+    candidates for the same query skip the forward pass.
+    """
+
+    def __init__(
+        self,
+        model: str = None,
+        batch_size: int = 32,
+        cache_size: int = None,
+    ):
+        self.model = model or config(
+            "NAGATO_CROSS_ENCODER_MODEL",
+            default="cross-encoder/ms-marco-MiniLM-L-6-v2",
+        )
+        self.batch_size = batch_size
+        self.cache_size = (
+            cache_size
+            if cache_size is not None
+            else config("NAGATO_RERANK_CACHE_SIZE", default=10000, cast=int)
+        )
+        self._scores: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def warmup(self) -> None:
+        model_registry.get(model_name=self.model, loader=load_cross_encoder)
+
+    def _key(self, query: str, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{query}\0{text}".encode()).hexdigest()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        return self.score_pairs(pairs=[(query, text) for text in texts])
+
+    def score_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        keys = [self._key(query=query, text=text) for query, text in pairs]
+        with self._lock:
+            scores = [self._scores.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            model = model_registry.get(model_name=self.model, loader=load_cross_encoder)
+            predicted = model.predict(
+                [pairs[i] for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._scores[key] = score
+                self._scores.move_to_end(key)
+            while len(self._scores) > self.cache_size:
+                self._scores.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, documents: list, top_n: int = 3) -> List[Dict]:
+        matches = [as_match(doc) for doc in documents]
+        scores = self.score(
+            query=query, texts=[format_document(match) for match in matches]
+        )
+        ranked = sorted(range(len(matches)), key=lambda i: scores[i], reverse=True)
+        return [{**matches[i], "score": scores[i]} for i in ranked[:top_n]]
+
+    def rerank_many(
+        self,
+        queries: List[str],
+        documents: List[list],
+        top_n: int = 3,
+        max_concurrency: int = 8,
+    ) -> List[List[Dict]]:
+        """Rerank every query's documents with one batched `predict` over the
+        (query, document) pairs of all queries."""
+        matches = [[as_match(doc) for doc in docs] for docs in documents]
+        scores = self.score_pairs(
+            pairs=[
+                (query, format_document(match))
+                for query, batch in zip(queries, matches)
+                for match in batch
+            ]
+        )
+        results, start = [], 0
+        for batch in matches:
+            batch_scores = scores[start : start + len(batch)]
+            start += len(batch)
+            ranked = sorted(
+                range(len(batch)), key=lambda i: batch_scores[i], reverse=True
+            )
+            results.append(
+                [{**batch[i], "score": batch_scores[i]} for i in ranked[:top_n]]
+            )
+        return results
+
+
+_rerank_lock = threading.Lock()
+_rerank_services: Dict[str, RerankService] = {}
+
+
+def get_rerank_service(provider: str = None) -> RerankService:
+    provider = provider or config("NAGATO_RERANK_PROVIDER", default="COHERE")
+    services = {
+        "COHERE": CohereRerankService,
+        "CROSS_ENCODER": CrossEncoderRerankService,
+        # Add other providers here
+    }
+    service = services.get(provider)
+    if service is None:
+        raise ValueError(f"Unsupported provider: {provider}")
+    with _rerank_lock:
+        if provider not in _rerank_services:
+            _rerank_services[provider] = service()
+        return _rerank_services[provider]
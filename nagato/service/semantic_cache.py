@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from decouple import config
+from numpy import ndarray
+from openai.util import convert_to_openai_object
+
+from nagato.service.query import QueryService
+from nagato.utils.sqlite_cache import SQLiteStore
+
+
+def context_hash(
+    model: str, system_prompt: str, context: Any, max_tokens: int = None
+) -> str:
+    """Fingerprint of everything besides the question that shapes an answer."""
+    payload = json.dumps(
+        [model, system_prompt, context, max_tokens], sort_keys=True, default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SemanticAnswerStore(SQLiteStore):
+    """Cached answers of one index in a SQLite file, safe to share between
+    processes. Each value is the normalized float32 question embedding
+    followed by the question and answer as JSON.
+    """
+
+    def __init__(self, path: str, dimension: int, max_entries: int = 0, ttl: float = 0):
+        super().__init__(path=path, table="answers", max_entries=max_entries, ttl=ttl)
+        self.dimension = dimension
+
+    def encode(self, value: Tuple[ndarray, Dict]) -> bytes:
+        embedding, record = value
+        return (
+            np.asarray(embedding, dtype=np.float32).tobytes()
+            + json.dumps(record).encode()
+        )
+
+    def decode(self, blob: bytes) -> Tuple[ndarray, Dict]:
+        split = self.dimension * np.dtype(np.float32).itemsize
+        return np.frombuffer(blob[:split], dtype=np.float32), json.loads(blob[split:])
+
+
+_stores_lock = threading.Lock()
+_stores: Dict[str, SemanticAnswerStore] = {}
+
+
+def get_semantic_answer_store(index_name: str, dimension: int) -> SemanticAnswerStore:
+    path = os.path.join(
+        config("NAGATO_SEMANTIC_CACHE_PATH", default=".nagato/semantic-cache"),
+        f"{index_name}.db",
+    )
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SemanticAnswerStore(
+                path=path,
+                dimension=dimension,
+                max_entries=config(
+                    "NAGATO_SEMANTIC_CACHE_MAX_ENTRIES", default=10000, cast=int
+                ),
+                ttl=config("NAGATO_SEMANTIC_CACHE_TTL", default=0, cast=float),
+            )
+        return store
+
+
+class SemanticAnswerCache:
+    """Answers to earlier questions, looked up by question similarity.
+
+    Question embeddings are stored in a `SemanticAnswerStore` next to the
+    answer, keyed by `filter_id` and the `context_hash` the answer was
+    generated from. A cached answer is reused when a new question's cosine
+    similarity reaches `threshold` and the retrieved context is unchanged, so
+    paraphrases of hot questions skip the LLM call while answers never
+    outlive the documents behind them. The store is bounded by
+    NAGATO_SEMANTIC_CACHE_MAX_ENTRIES (least recently used answers are
+    evicted) and NAGATO_SEMANTIC_CACHE_TTL seconds.
+    """
+
+    def __init__(
+        self,
+        index_name: str,
+        dimension: int,
+        filter_id: str = None,
+        threshold: float = None,
+    ):
+        self.filter_id = filter_id
+        self.threshold = (
+            threshold
+            if threshold is not None
+            else config("NAGATO_SEMANTIC_CACHE_THRESHOLD", default=0.95, cast=float)
+        )
+        self.answers = get_semantic_answer_store(
+            index_name=index_name, dimension=dimension
+        )
+
+    def _prefix(self, context_hash: str) -> str:
+        key = f"{self.filter_id or ''}\0{context_hash}"
+        return hashlib.sha256(key.encode()).hexdigest() + ":"
+
+    def lookup(self, embedding: List[float], context_hash: str) -> Optional[str]:
+        entries = self.answers.scan(prefix=self._prefix(context_hash))
+        if not entries:
+            return None
+        keys = list(entries)
+        matrix = np.stack([entries[key][1][0] for key in keys])
+        scores = matrix @ normalize(embedding)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        self.answers.touch(keys=[keys[best]])
+        return entries[keys[best]][1][1]["answer"]
+
+    def store(
+        self, question: str, embedding: List[float], context_hash: str, answer: str
+    ) -> None:
+        key = self._prefix(context_hash) + hashlib.sha256(question.encode()).hexdigest()
+        self.answers.put_many(
+            {key: (normalize(embedding), {"question": question, "answer": answer})}
+        )
+
+
+def normalize(embedding: List[float]) -> ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def cached_predict_with_embedding(
+    cache: SemanticAnswerCache,
+    query_service: QueryService,
+    embedding: List[float],
+    input: str,
+    context: Any,
+    system_prompt: str,
+    enable_streaming: bool = False,
+    callback: Callable = None,
+    max_tokens: int = 2000,
+):
+    """`QueryService.predict_with_embedding` behind a `SemanticAnswerCache`.
+
+    On a hit the cached answer is returned as a completion response (and
+    passed to `callback` in one piece when streaming). On a miss, streamed
+    chunks are collected on their way to `callback` so the full answer can
+    be stored.
+    """
+    key = context_hash(
+        model=query_service.model,
+        system_prompt=system_prompt,
+        context=context,
+        max_tokens=max_tokens,
+    )
+    answer = cache.lookup(embedding=embedding, context_hash=key)
+    if answer is not None:
+        if enable_streaming:
+            callback(answer)
+        return convert_to_openai_object(
+            {
+                "model": query_service.model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+        )
+
+    chunks = []
+
+    def collecting_callback(chunk):
+        if chunk:
+            chunks.append(chunk)
+        callback(chunk)
+
+    output = query_service.predict_with_embedding(
+        input=input,
+        context=context,
+        system_prompt=system_prompt,
+        enable_streaming=enable_streaming,
+        callback=collecting_callback if enable_streaming else callback,
+        max_tokens=max_tokens,
+    )
+    answer = (
+        "".join(chunks)
+        if enable_streaming
+        else output["choices"][0]["message"]["content"]
+    )
+    if answer:
+        cache.store(
+            question=input, embedding=embedding, context_hash=key, answer=answer
+        )
+    return output
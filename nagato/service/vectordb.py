@@ -1,10 +1,18 @@
+import json
+import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Any, List
+from typing import Any, Dict, List, Set, Tuple
 
-import pinecone
+import numpy as np
 from decouple import config
 from numpy import ndarray
 
+from nagato.service.rerank import get_rerank_service
+from nagato.utils.aio import run_in_executor
+from nagato.utils.batching import batched, map_concurrent
+from nagato.utils.ivf import IVFIndex
+
 
 class VectorDBService(ABC):
     def __init__(self, index_name: str, dimension: int, filter_id: str = None):
@@ -21,26 +29,70 @@ class VectorDBService(ABC):
         pass
 
     @abstractmethod
-    def rerank(self, query: str, documents: list, top_n: int = 3):
+    def delete(self, ids: List[str]):
         pass
 
+    def query_many(
+        self,
+        queries: List[ndarray],
+        top_k: int,
+        include_metadata: bool = True,
+        max_concurrency: int = 8,
+    ) -> List[List]:
+        """Matches for every query in `queries`, in order.
+
+        Queries are sent as separate requests, at most `max_concurrency` at
+        a time.
+        """
+        return map_concurrent(
+            lambda query: self.query(
+                queries=[query], top_k=top_k, include_metadata=include_metadata
+            ),
+            queries,
+            max_workers=max_concurrency,
+        )
+
+    def rerank(self, query: str, documents: Any, top_n: int = 3, provider: str = None):
+        return get_rerank_service(provider=provider).rerank(
+            query=query, documents=documents, top_n=top_n
+        )
+
+    def rerank_many(
+        self,
+        queries: List[str],
+        documents: List[Any],
+        top_n: int = 3,
+        provider: str = None,
+        max_concurrency: int = 8,
+    ) -> List[List[dict]]:
+        return get_rerank_service(provider=provider).rerank_many(
+            queries=queries,
+            documents=documents,
+            top_n=top_n,
+            max_concurrency=max_concurrency,
+        )
+
+    async def aquery(
+        self, queries: List[ndarray], top_k: int, include_metadata: bool = True
+    ):
+        return await run_in_executor(
+            self.query, queries=queries, top_k=top_k, include_metadata=include_metadata
+        )
+
+    async def arerank(
+        self, query: str, documents: Any, top_n: int = 3, provider: str = None
+    ):
+        return await get_rerank_service(provider=provider).arerank(
+            query=query, documents=documents, top_n=top_n
+        )
+
 
 class PineconeVectorService(VectorDBService):
     def __init__(self, index_name: str, dimension: int, filter_id: str = None):
         super().__init__(
             index_name=index_name, dimension=dimension, filter_id=filter_id
         )
-        pinecone.init(
-            api_key=config("PINECONE_API_KEY"),
-            environment=config("PINECONE_ENVIRONMENT"),
-        )
-        # Create a new vector index if it doesn't
-        # exist dimensions should be passed in the arguments
-        if index_name not in pinecone.list_indexes():
-            pinecone.create_index(
-                name=index_name, metric="cosine", shards=1, dimension=dimension
-            )
-        self.index = pinecone.Index(index_name=self.index_name)
+        self.index = get_pinecone_index(index_name=index_name, dimension=dimension)
 
     def upsert(self, vectors: ndarray):
         self.index.upsert(vectors=vectors, namespace=self.filter_id)
@@ -54,41 +106,464 @@ class PineconeVectorService(VectorDBService):
         )
         return results["results"][0]["matches"]
 
-    def rerank(self, query: str, documents: Any, top_n: int = 3):
-        from cohere import Client
-
-        api_key = config("COHERE_API_KEY")
-        if not api_key:
-            raise ValueError("API key for Cohere is not present.")
-        cohere_client = Client(api_key=api_key)
-        docs = [
-            (
-                f"{doc['metadata']['content']}\n\n"
-                f"page number: {doc['metadata']['page_label']}"
+    def query_many(
+        self,
+        queries: List[ndarray],
+        top_k: int,
+        include_metadata: bool = True,
+        max_concurrency: int = 8,
+    ) -> List[List]:
+        """Matches for every query, `NAGATO_PINECONE_QUERIES_PER_REQUEST`
+        queries per request and at most `max_concurrency` requests at a time."""
+        per_request = config(
+            "NAGATO_PINECONE_QUERIES_PER_REQUEST", default=10, cast=int
+        )
+
+        def request(batch: List[ndarray]) -> List[List]:
+            results = self.index.query(
+                queries=batch,
+                top_k=top_k,
+                include_metadata=include_metadata,
+                namespace=self.filter_id,
             )
-            for doc in documents
+            return [result["matches"] for result in results["results"]]
+
+        responses = map_concurrent(
+            request, batched(queries, per_request), max_workers=max_concurrency
+        )
+        return [matches for response in responses for matches in response]
+
+    def delete(self, ids: List[str]):
+        for batch in batched(ids, 1000):
+            self.index.delete(ids=batch, namespace=self.filter_id)
+
+
+class LocalVectorService(VectorDBService):
+    """In-process vector index for small corpora, tests and benchmarks.
+
+    Vectors live in a memory-mapped float32 matrix (`vectors.f32`) and their
+    ids and metadata in an append-only side file (`metadata.jsonl`), one
+    directory per index and `filter_id` namespace. Vectors are L2-normalized
+    on upsert so exact cosine top-k is a single matrix-vector product.
+    """
+
+    def __init__(self, index_name: str, dimension: int, filter_id: str = None):
+        super().__init__(
+            index_name=index_name, dimension=dimension, filter_id=filter_id
+        )
+        self.path = os.path.join(
+            config("NAGATO_LOCAL_VECTOR_PATH", default=".nagato/vectors"),
+            index_name,
+            filter_id or "__default__",
+        )
+        os.makedirs(self.path, exist_ok=True)
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._metadata_path = os.path.join(self.path, "metadata.jsonl")
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._metadata: List[dict] = []
+        self._rows: Dict[str, int] = {}
+        self._deleted: Set[int] = set()
+        self._deleted_rows = np.empty(0, dtype=np.int64)
+        self._matrix = None
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self._metadata_path):
+            return
+        with open(self._metadata_path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                row = record["row"]
+                if record.get("deleted"):
+                    self._rows.pop(record["id"], None)
+                    self._deleted.add(row)
+                    self._metadata[row] = {}
+                    continue
+                if row == len(self._ids):
+                    self._ids.append(record["id"])
+                    self._metadata.append(record["metadata"])
+                else:
+                    self._ids[row] = record["id"]
+                    self._metadata[row] = record["metadata"]
+                self._rows[record["id"]] = row
+        self._deleted_rows = np.fromiter(self._deleted, dtype=np.int64)
+
+    @property
+    def matrix(self) -> ndarray:
+        if self._matrix is None:
+            if not self._ids:
+                return np.empty((0, self.dimension), dtype=np.float32)
+            self._matrix = np.memmap(
+                self._vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(len(self._ids), self.dimension),
+            )
+        return self._matrix
+
+    def upsert(self, vectors: List[Any]):
+        batch = {}
+        for item in vectors:
+            if isinstance(item, dict):
+                id_, values, metadata = item["id"], item["values"], item.get("metadata")
+            else:
+                id_, values, metadata = (tuple(item) + (None,))[:3]
+            batch[id_] = (values, metadata or {})
+        if not batch:
+            return
+        ids = list(batch.keys())
+        matrix = normalize(
+            np.asarray([values for values, _ in batch.values()], dtype=np.float32)
+        )
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(
+                f"Expected vectors of dimension {self.dimension}, got {matrix.shape[1]}"
+            )
+        with self._lock:
+            records, appended, updated = [], [], []
+            for position, id_ in enumerate(ids):
+                row = self._rows.get(id_)
+                if row is None:
+                    row = len(self._ids) + len(appended)
+                    appended.append(position)
+                else:
+                    updated.append((row, position))
+                records.append({"id": id_, "row": row, "metadata": batch[id_][1]})
+            self._matrix = None
+            if updated:
+                with open(self._vectors_path, "r+b") as f:
+                    for row, position in updated:
+                        f.seek(row * self.dimension * 4)
+                        f.write(matrix[position].tobytes())
+            if appended:
+                with open(self._vectors_path, "ab") as f:
+                    f.write(matrix[appended].tobytes())
+            with open(self._metadata_path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            for record in records:
+                if record["row"] == len(self._ids):
+                    self._ids.append(record["id"])
+                    self._metadata.append(record["metadata"])
+                else:
+                    self._metadata[record["row"]] = record["metadata"]
+                self._rows[record["id"]] = record["row"]
+            self._index_rows(rows=[record["row"] for record in records], vectors=matrix)
+
+    def _index_rows(self, rows: List[int], vectors: ndarray) -> None:
+        """Hook for subclasses that maintain a secondary index over rows."""
+
+    def delete(self, ids: List[str]):
+        """Tombstone `ids`. Their rows stay in the matrix but never match."""
+        with self._lock:
+            records = []
+            for id_ in ids:
+                row = self._rows.pop(id_, None)
+                if row is not None:
+                    self._deleted.add(row)
+                    self._metadata[row] = {}
+                    records.append({"id": id_, "row": row, "deleted": True})
+            if not records:
+                return
+            with open(self._metadata_path, "a") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            self._deleted_rows = np.fromiter(self._deleted, dtype=np.int64)
+
+    def query(self, queries: List[ndarray], top_k: int, include_metadata: bool = True):
+        return self._query(
+            queries=queries[:1], top_k=top_k, include_metadata=include_metadata
+        )[0]
+
+    def query_many(
+        self,
+        queries: List[ndarray],
+        top_k: int,
+        include_metadata: bool = True,
+        max_concurrency: int = 8,
+    ) -> List[List]:
+        """Matches for every query, scored with one matrix product per block
+        of queries rather than one matrix-vector product per query."""
+        return self._query(
+            queries=queries, top_k=top_k, include_metadata=include_metadata
+        )
+
+    def _query(
+        self,
+        queries: List[ndarray],
+        top_k: int,
+        include_metadata: bool = True,
+        **search_options,
+    ) -> List[List]:
+        with self._lock:
+            matrix = self.matrix
+            ids, metadata = self._ids, self._metadata
+            deleted = self._deleted_rows
+            state = self._search_state()
+        if not len(queries):
+            return []
+        if not len(matrix):
+            return [[] for _ in queries]
+        queries = normalize(np.asarray(queries, dtype=np.float32))
+        results = self._search_many(
+            matrix=matrix,
+            queries=queries,
+            top_k=top_k,
+            deleted=deleted,
+            **state,
+            **search_options,
+        )
+        return [
+            [
+                {
+                    "id": ids[row],
+                    "score": float(score),
+                    "metadata": metadata[row] if include_metadata else {},
+                }
+                for row, score in zip(rows, scores)
+                if np.isfinite(score)
+            ]
+            for rows, scores in results
         ]
-        re_ranked = cohere_client.rerank(
-            model="rerank-multilingual-v2.0",
-            query=query,
-            documents=docs,
-            top_n=top_n,
-        ).results
+
+    def _search_state(self) -> Dict[str, Any]:
+        """Hook for subclasses: secondary index state for `_search_many`,
+        snapshotted under the lock together with the matrix."""
+        return {}
+
+    def _search(
+        self, matrix: ndarray, query: ndarray, top_k: int, deleted: ndarray
+    ) -> Tuple[ndarray, ndarray]:
+        scores = matrix @ query
+        scores[deleted[deleted < len(scores)]] = -np.inf
+        rows = top_k_rows(scores, top_k)
+        return rows, scores[rows]
+
+    def _search_many(
+        self, matrix: ndarray, queries: ndarray, top_k: int, deleted: ndarray
+    ) -> List[Tuple[ndarray, ndarray]]:
+        # Blocks of queries keep the (queries, rows) score matrix near 128 MiB
+        block = max(1, SCORE_BLOCK_ELEMENTS // len(matrix))
+        deleted = deleted[deleted < len(matrix)]
         results = []
-        for obj in re_ranked:
-            results.append(obj.document["text"])
+        for start in range(0, len(queries), block):
+            scores = queries[start : start + block] @ matrix.T
+            scores[:, deleted] = -np.inf
+            for query_scores in scores:
+                rows = top_k_rows(query_scores, top_k)
+                results.append((rows, query_scores[rows]))
         return results
 
 
+class LocalIVFVectorService(LocalVectorService):
+    """`LocalVectorService` with an IVF approximate nearest-neighbour index.
+
+    Below `NAGATO_IVF_TRAIN_THRESHOLD` vectors queries stay exact. Once the
+    threshold is crossed the index is trained, new vectors are assigned to
+    lists incrementally, and the clustering is rebuilt whenever the index
+    has grown `NAGATO_IVF_RETRAIN_FACTOR` times past its last training.
+    `NAGATO_IVF_NLIST` (0 = sqrt(n)) and `NAGATO_IVF_NPROBE` are the
+    recall/latency knobs; `nprobe` can also be set per query.
+    """
+
+    def __init__(self, index_name: str, dimension: int, filter_id: str = None):
+        self.train_threshold = config(
+            "NAGATO_IVF_TRAIN_THRESHOLD", default=4096, cast=int
+        )
+        self.retrain_factor = config("NAGATO_IVF_RETRAIN_FACTOR", default=4, cast=int)
+        super().__init__(
+            index_name=index_name, dimension=dimension, filter_id=filter_id
+        )
+        self.ivf = IVFIndex(
+            path=self.path,
+            nlist=config("NAGATO_IVF_NLIST", default=0, cast=int),
+            nprobe=config("NAGATO_IVF_NPROBE", default=8, cast=int),
+        )
+        if self.ivf.trained and self.ivf.size != len(self._ids):
+            self.ivf.train(self.matrix)
+
+    def _index_rows(self, rows: List[int], vectors: ndarray) -> None:
+        size = len(self._ids)
+        if size < self.train_threshold:
+            return
+        if not self.ivf.trained or size > self.ivf.trained_rows * self.retrain_factor:
+            self.ivf.train(self.matrix)
+        else:
+            self.ivf.add(rows=rows, vectors=vectors)
+
+    def _search_state(self) -> Dict[str, Any]:
+        # A retrain during upsert replaces centroids and lists together, so
+        # queries must take both from the same moment
+        return {"lists": self.ivf.lists()}
+
+    def query(
+        self,
+        queries: List[ndarray],
+        top_k: int,
+        include_metadata: bool = True,
+        nprobe: int = None,
+    ):
+        return self._query(
+            queries=queries[:1],
+            top_k=top_k,
+            include_metadata=include_metadata,
+            nprobe=nprobe,
+        )[0]
+
+    def query_many(
+        self,
+        queries: List[ndarray],
+        top_k: int,
+        include_metadata: bool = True,
+        max_concurrency: int = 8,
+        nprobe: int = None,
+    ) -> List[List]:
+        return self._query(
+            queries=queries,
+            top_k=top_k,
+            include_metadata=include_metadata,
+            nprobe=nprobe,
+        )
+
+    def _search(
+        self,
+        matrix: ndarray,
+        query: ndarray,
+        top_k: int,
+        deleted: ndarray,
+        nprobe: int = None,
+        lists: Tuple[ndarray, ndarray, ndarray] = None,
+    ) -> Tuple[ndarray, ndarray]:
+        if lists is None:
+            return super()._search(
+                matrix=matrix, query=query, top_k=top_k, deleted=deleted
+            )
+        candidates = self.ivf.candidates(query=query, nprobe=nprobe, lists=lists)
+        candidates = np.setdiff1d(candidates[candidates < len(matrix)], deleted)
+        scores = matrix[candidates] @ query
+        best = top_k_rows(scores, top_k)
+        return candidates[best], scores[best]
+
+    def _search_many(
+        self,
+        matrix: ndarray,
+        queries: ndarray,
+        top_k: int,
+        deleted: ndarray,
+        nprobe: int = None,
+        lists: Tuple[ndarray, ndarray, ndarray] = None,
+    ) -> List[Tuple[ndarray, ndarray]]:
+        if lists is None:
+            return super()._search_many(
+                matrix=matrix, queries=queries, top_k=top_k, deleted=deleted
+            )
+        return [
+            self._search(
+                matrix=matrix,
+                query=query,
+                top_k=top_k,
+                deleted=deleted,
+                nprobe=nprobe,
+                lists=lists,
+            )
+            for query in queries
+        ]
+
+
+SCORE_BLOCK_ELEMENTS = 1 << 25
+
+
+def normalize(matrix: ndarray) -> ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def top_k_rows(scores: ndarray, top_k: int) -> ndarray:
+    """Indices of the `top_k` highest `scores`, best first."""
+    if top_k >= len(scores):
+        return np.argsort(-scores)
+    rows = np.argpartition(-scores, top_k)[:top_k]
+    return rows[np.argsort(-scores[rows])]
+
+
+_pinecone_lock = threading.Lock()
+_pinecone_initialized = False
+_pinecone_indexes: Dict[str, Any] = {}
+
+
+def get_pinecone_index(index_name: str, dimension: int):
+    """Return a shared `pinecone.Index`, initializing the client once.
+
+    The index-existence check (a control-plane round-trip) only runs the
+    first time an index is requested; afterwards the same `Index` and its
+    pooled HTTP connections are reused for every namespace.
+    """
+    import pinecone
+
+    global _pinecone_initialized
+    with _pinecone_lock:
+        index = _pinecone_indexes.get(index_name)
+        if index is not None:
+            return index
+        if not _pinecone_initialized:
+            pinecone.init(
+                api_key=config("PINECONE_API_KEY"),
+                environment=config("PINECONE_ENVIRONMENT"),
+            )
+            _pinecone_initialized = True
+        # Create a new vector index if it doesn't
+        # exist dimensions should be passed in the arguments
+        if index_name not in pinecone.list_indexes():
+            pinecone.create_index(
+                name=index_name, metric="cosine", shards=1, dimension=dimension
+            )
+        index = pinecone.Index(
+            index_name=index_name,
+            pool_threads=config("PINECONE_POOL_THREADS", default=4, cast=int),
+        )
+        _pinecone_indexes[index_name] = index
+        return index
+
+
+_service_lock = threading.Lock()
+_service_cache: Dict[Tuple[str, str, str, int], VectorDBService] = {}
+
+
 def get_vector_service(
-    provider: str, index_name: str, filter_id: str = None, dimension: int = 384
+    provider: str,
+    index_name: str,
+    filter_id: str = None,
+    dimension: int = 384,
+    use_cache: bool = True,
 ):
+    key = (provider, index_name, filter_id, dimension)
+    if use_cache:
+        with _service_lock:
+            service = _service_cache.get(key)
+        if service is not None:
+            return service
     services = {
         "PINECONE": PineconeVectorService,
+        "LOCAL": LocalVectorService,
+        "LOCAL_IVF": LocalIVFVectorService,
         # Add other providers here
         # e.g "weaviate": WeaviateVectorService,
     }
     service = services.get(provider)
     if service is None:
         raise ValueError(f"Unsupported provider: {provider}")
-    return service(index_name=index_name, filter_id=filter_id, dimension=dimension)
+    vector_service = service(
+        index_name=index_name, filter_id=filter_id, dimension=dimension
+    )
+    if use_cache:
+        with _service_lock:
+            vector_service = _service_cache.setdefault(key, vector_service)
+    return vector_service
+
+
+def clear_vector_service_cache() -> None:
+    with _service_lock:
+        _service_cache.clear()
+    with _pinecone_lock:
+        _pinecone_indexes.clear()
@@ -0,0 +1,40 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict
+
+from decouple import config
+
+# Blocking work of the async API runs on dedicated pools rather than the
+# loop's default executor: "retrieval" for the short calls on the query path
+# (encoding, vector queries, reranking) and "background" for whole
+# ingestions and batch jobs, so long ingestions cannot starve queries.
+POOL_SIZES = {
+    "retrieval": ("NAGATO_RETRIEVAL_THREADS", 64),
+    "background": ("NAGATO_BACKGROUND_THREADS", 4),
+}
+
+_executors_lock = threading.Lock()
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+
+def get_executor(pool: str) -> ThreadPoolExecutor:
+    """The shared thread pool `pool`, sized by its NAGATO_*_THREADS setting."""
+    with _executors_lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            name, default = POOL_SIZES[pool]
+            executor = _executors[pool] = ThreadPoolExecutor(
+                max_workers=config(name, default=default, cast=int),
+                thread_name_prefix=f"nagato-{pool}",
+            )
+        return executor
+
+
+async def run_in_executor(
+    fn: Callable, *args, pool: str = "retrieval", **kwargs
+) -> Any:
+    """Run blocking `fn` on the `pool` thread pool and await the result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(pool), partial(fn, *args, **kwargs))
@@ -0,0 +1,77 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Set
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Yield lists of at most `size` items from `items`."""
+    if size < 1:
+        raise ValueError("Batch size must be at least 1")
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def map_concurrent(fn: Callable, items: Iterable, max_workers: int = 8) -> List:
+    """`[fn(item) for item in items]` on at most `max_workers` threads.
+
+    Results keep the order of `items`; the first error is re-raised.
+    """
+    items = list(items)
+    if len(items) <= 1 or max_workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+class BoundedExecutor:
+    """Thread pool whose `submit` blocks once `max_in_flight` tasks are pending.
+
+    This gives producers back-pressure: a fast producer (e.g. the encoder)
+    can never queue more than `max_in_flight` results for a slow consumer
+    (e.g. network upserts). The first task error is re-raised on the next
+    `submit` or on `join`.
+    """
+
+    def __init__(self, max_in_flight: int = 4):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._in_flight: Set[Future] = set()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        # Surface errors of tasks that already finished, even with room to spare
+        self._collect(timeout=0)
+        while len(self._in_flight) >= self.max_in_flight:
+            self._collect(return_when=FIRST_COMPLETED)
+        future = self._executor.submit(fn, *args, **kwargs)
+        self._in_flight.add(future)
+        return future
+
+    def join(self) -> None:
+        while self._in_flight:
+            self._collect()
+
+    def _collect(
+        self, return_when: str = FIRST_COMPLETED, timeout: float = None
+    ) -> None:
+        done, self._in_flight = wait(
+            self._in_flight, timeout=timeout, return_when=return_when
+        )
+        for future in done:
+            future.result()
+
+    def __enter__(self) -> "BoundedExecutor":
+        return self
+
+    def __exit__(self, exc_type, _exc, _tb) -> None:
+        try:
+            if exc_type is None:
+                self.join()
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=exc_type is not None)
@@ -0,0 +1,267 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List
+
+import numpy as np
+from numpy import ndarray
+
+# Words, plus compound tokens such as tickers ("TSLA-123"), figures
+# ("1,234.5") and part numbers ("AB/123-X"), which are also split into parts
+TOKEN_PATTERN = re.compile(r"\w+(?:[.,\-/:]\w+)*")
+TOKEN_SEPARATORS = re.compile(r"[.,\-/:]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if TOKEN_SEPARATORS.search(token):
+            tokens.extend(part for part in TOKEN_SEPARATORS.split(token) if part)
+    return tokens
+
+
+def encode_postings(offsets: ndarray, rows: ndarray) -> ndarray:
+    """Delta-encode the ascending rows of every posting list as uint32 gaps."""
+    gaps = rows.astype(np.int64)
+    gaps[1:] -= rows[:-1].astype(np.int64)
+    starts = offsets[:-1][np.diff(offsets) > 0]
+    gaps[starts] = rows[starts]
+    return gaps.astype(np.uint32)
+
+
+def decode_postings(offsets: ndarray, gaps: ndarray) -> ndarray:
+    totals = np.cumsum(gaps, dtype=np.int64)
+    before = np.concatenate([[0], totals])[offsets[:-1]]
+    return (totals - np.repeat(before, np.diff(offsets))).astype(np.uint32)
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over text chunks, stored in `path`.
+
+    Postings are held in CSR form: the rows containing term `t` are
+    `postings[offsets[t]:offsets[t + 1]]` (ascending) with their term counts
+    in `tfs`. On disk (`postings.npz`, zlib-compressed) rows are stored as
+    uint32 gaps and counts as uint16; ids and metadata of the rows are in
+    `docs.jsonl`. Deleted rows are tombstoned and dropped on `save` once they
+    make up a quarter of the index.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._postings_path = os.path.join(path, "postings.npz")
+        self._docs_path = os.path.join(path, "docs.jsonl")
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._reset()
+        self._load()
+
+    def _reset(self) -> None:
+        self.ids: List[str] = []
+        self.metadata: List[dict] = []
+        self.vocabulary: Dict[str, int] = {}
+        self._rows: Dict[str, int] = {}
+        self.lengths = np.empty(0, dtype=np.uint32)
+        self.deleted = np.empty(0, dtype=bool)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings = np.empty(0, dtype=np.uint32)
+        self.tfs = np.empty(0, dtype=np.uint16)
+
+    @property
+    def size(self) -> int:
+        return len(self._rows)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._postings_path):
+            return
+        self._mtime = os.path.getmtime(self._postings_path)
+        with np.load(self._postings_path) as data:
+            self.vocabulary = {
+                term: term_id for term_id, term in enumerate(data["terms"].tolist())
+            }
+            self.offsets = data["offsets"]
+            self.postings = decode_postings(offsets=self.offsets, gaps=data["gaps"])
+            self.tfs = data["tfs"]
+            self.lengths = data["lengths"]
+            self.deleted = data["deleted"]
+        with open(self._docs_path, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.metadata.append(record["metadata"])
+        self._rows = {
+            id_: row for row, id_ in enumerate(self.ids) if not self.deleted[row]
+        }
+
+    def reload_if_changed(self) -> None:
+        """Pick up an index saved by another process since it was loaded."""
+        mtime = (
+            os.path.getmtime(self._postings_path)
+            if os.path.exists(self._postings_path)
+            else None
+        )
+        with self._lock:
+            if mtime != self._mtime:
+                self._reset()
+                self._load()
+
+    def _term_ids(self) -> ndarray:
+        return np.repeat(
+            np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets)
+        )
+
+    def add(self, ids: List[str], texts: List[str], metadata: List[dict] = None):
+        """Index `texts` under `ids`, replacing rows already stored for them."""
+        documents = dict(zip(ids, zip(texts, metadata or [{}] * len(ids))))
+        with self._lock:
+            self._delete(ids=list(documents))
+            terms, rows, tfs, lengths = [], [], [], []
+            for id_, (text, meta) in documents.items():
+                row = len(self.ids)
+                counts = Counter(tokenize(text))
+                for term, count in counts.items():
+                    terms.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                    rows.append(row)
+                    tfs.append(min(count, np.iinfo(np.uint16).max))
+                lengths.append(sum(counts.values()))
+                self.ids.append(id_)
+                self.metadata.append(meta)
+                self._rows[id_] = row
+            self.lengths = np.concatenate(
+                [self.lengths, np.asarray(lengths, dtype=np.uint32)]
+            )
+            self.deleted = np.concatenate(
+                [self.deleted, np.zeros(len(lengths), dtype=bool)]
+            )
+            self._merge_postings(
+                terms=np.asarray(terms, np.int64),
+                rows=np.asarray(rows, np.uint32),
+                tfs=np.asarray(tfs, np.uint16),
+            )
+
+    def _merge_postings(self, terms: ndarray, rows: ndarray, tfs: ndarray) -> None:
+        """Merge new postings into the sorted CSR arrays without re-sorting
+        them. New rows come after every existing row, so each term's new
+        postings go at the end of its list."""
+        order = np.lexsort((rows, terms))
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        old_counts = np.zeros(len(self.vocabulary), dtype=np.int64)
+        old_counts[: len(self.offsets) - 1] = np.diff(self.offsets)
+        new_counts = np.bincount(terms, minlength=len(self.vocabulary))
+        offsets = np.concatenate([[0], np.cumsum(old_counts + new_counts)])
+        old_terms = self._term_ids()
+        old_positions = (
+            np.arange(len(self.postings)) - self.offsets[old_terms] + offsets[old_terms]
+        )
+        new_starts = np.concatenate([[0], np.cumsum(new_counts)])
+        new_positions = (
+            np.arange(len(rows))
+            - new_starts[terms]
+            + offsets[terms]
+            + old_counts[terms]
+        )
+        postings = np.empty(offsets[-1], dtype=np.uint32)
+        postings[old_positions] = self.postings
+        postings[new_positions] = rows
+        merged_tfs = np.empty(offsets[-1], dtype=np.uint16)
+        merged_tfs[old_positions] = self.tfs
+        merged_tfs[new_positions] = tfs
+        self.postings, self.tfs = postings, merged_tfs
+        self.offsets = offsets.astype(np.int64)
+
+    def _set_postings(self, terms: ndarray, rows: ndarray, tfs: ndarray) -> None:
+        order = np.lexsort((rows, terms))
+        self.postings = rows[order]
+        self.tfs = tfs[order]
+        counts = np.bincount(terms, minlength=len(self.vocabulary))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._delete(ids=ids)
+
+    def _delete(self, ids: List[str]) -> None:
+        for id_ in ids:
+            row = self._rows.pop(id_, None)
+            if row is not None:
+                self.deleted[row] = True
+                self.metadata[row] = {}
+
+    def _compact(self) -> None:
+        if not self.deleted.any() or self.deleted.sum() * 4 < len(self.ids):
+            return
+        live = ~self.deleted
+        new_rows = np.cumsum(live) - 1
+        keep = live[self.postings]
+        self._set_postings(
+            terms=self._term_ids()[keep],
+            rows=new_rows[self.postings[keep]].astype(np.uint32),
+            tfs=self.tfs[keep],
+        )
+        self.ids = [id_ for id_, alive in zip(self.ids, live) if alive]
+        self.metadata = [meta for meta, alive in zip(self.metadata, live) if alive]
+        self.lengths = self.lengths[live]
+        self.deleted = np.zeros(len(self.ids), dtype=bool)
+        self._rows = {id_: row for row, id_ in enumerate(self.ids)}
+
+    def save(self) -> None:
+        with self._lock:
+            self._compact()
+            os.makedirs(self.path, exist_ok=True)
+            with open(f"{self._docs_path}.tmp", "w") as f:
+                for id_, meta in zip(self.ids, self.metadata):
+                    f.write(json.dumps({"id": id_, "metadata": meta}) + "\n")
+            with open(f"{self._postings_path}.tmp", "wb") as f:
+                np.savez_compressed(
+                    f,
+                    terms=np.asarray(list(self.vocabulary), dtype=str),
+                    offsets=self.offsets,
+                    gaps=encode_postings(offsets=self.offsets, rows=self.postings),
+                    tfs=self.tfs,
+                    lengths=self.lengths,
+                    deleted=self.deleted,
+                )
+            os.replace(f"{self._docs_path}.tmp", self._docs_path)
+            os.replace(f"{self._postings_path}.tmp", self._postings_path)
+            self._mtime = os.path.getmtime(self._postings_path)
+
+    def search(self, query: str, top_k: int = 5) -> List[dict]:
+        """The `top_k` best-scoring rows for `query`, as vector-store matches."""
+        with self._lock:
+            if not self._rows:
+                return []
+            live = ~self.deleted
+            lengths = self.lengths.astype(np.float32)
+            norms = self.k1 * (1 - self.b + self.b * lengths / lengths[live].mean())
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            for term in set(tokenize(query)):
+                term_id = self.vocabulary.get(term)
+                if term_id is None:
+                    continue
+                start, end = self.offsets[term_id], self.offsets[term_id + 1]
+                rows = self.postings[start:end]
+                matched = live[rows]
+                rows = rows[matched]
+                if not len(rows):
+                    continue
+                tfs = self.tfs[start:end][matched].astype(np.float32)
+                idf = np.log1p((len(self._rows) - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + norms[rows])
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > top_k:
+                candidates = np.sort(
+                    candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+                )
+            best = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [
+                {
+                    "id": self.ids[row],
+                    "score": float(scores[row]),
+                    "metadata": self.metadata[row],
+                }
+                for row in best
+            ]
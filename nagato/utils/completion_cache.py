@@ -0,0 +1,83 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from decouple import config
+
+from nagato.utils.sqlite_cache import SQLiteStore, TieredCache
+
+
+def completion_key(
+    model: str, messages: List[Dict], temperature: float, max_tokens: int
+) -> str:
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_cacheable(temperature: float, stream: bool = False) -> bool:
+    """Only deterministic, non-streaming completions are cached."""
+    return temperature == 0 and not stream
+
+
+class CompletionStore(SQLiteStore):
+    """Persistent completion store backed by a single SQLite file.
+
+    Values are stored as JSON.
+    """
+
+    def __init__(self, path: str, max_entries: int = 0, ttl: float = 0):
+        super().__init__(
+            path=path, table="completions", max_entries=max_entries, ttl=ttl
+        )
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value).encode()
+
+    def decode(self, blob: bytes) -> Any:
+        return json.loads(blob)
+
+
+class CompletionCache(TieredCache):
+    """Two-tier cache of LLM completions keyed by `completion_key`.
+
+    The first tier is an in-memory LRU of `max_size` entries, the optional
+    second tier a `CompletionStore` on disk. Entries expire `ttl` seconds
+    after they were created (0 keeps them forever). Values must be JSON
+    serializable.
+    """
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_entries([key]).get(key)
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_entries({key: value})
+
+
+def _completion_store():
+    path = config("NAGATO_COMPLETION_CACHE_PATH", default="")
+    if not path:
+        return None
+    return CompletionStore(
+        path=path,
+        max_entries=config(
+            "NAGATO_COMPLETION_CACHE_MAX_ENTRIES", default=100000, cast=int
+        ),
+        ttl=config("NAGATO_COMPLETION_CACHE_TTL", default=0, cast=float),
+    )
+
+
+# Shared by QueryService and the fine-tuning Q&A generation; set
+# NAGATO_COMPLETION_CACHE_PATH to keep completions across runs.
+completion_cache = CompletionCache(
+    max_size=config("NAGATO_COMPLETION_CACHE_SIZE", default=256, cast=int),
+    ttl=config("NAGATO_COMPLETION_CACHE_TTL", default=0, cast=float),
+    store=_completion_store(),
+)
@@ -0,0 +1,103 @@
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Universal hashing (a * x + b) mod p over 31-bit shingle hashes, so every
+# product fits in uint64 and every signature value fits in uint32
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Word n-grams of the lowercased `text` (the whole text if it is shorter)."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i : i + size]) for i in range(len(words) - size + 1)]
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Pick `(bands, rows)` whose LSH S-curve crosses 0.5 nearest `threshold`."""
+    candidates = [
+        (bands, num_perm // bands)
+        for bands in range(1, num_perm + 1)
+        if num_perm % bands == 0
+    ]
+    return min(
+        candidates,
+        key=lambda option: abs((1 / option[0]) ** (1 / option[1]) - threshold),
+    )
+
+
+class MinHashDeduplicator:
+    """Streaming near-duplicate detector based on MinHash and banded LSH.
+
+    Every text is reduced to a `num_perm` MinHash signature, split into
+    bands that are bucketed in hash tables. A new text is only compared
+    against texts sharing at least one band bucket, so the cost per text
+    stays roughly constant instead of growing with the number of texts seen.
+    Candidates count as duplicates when their estimated Jaccard similarity
+    is at least `threshold`.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        seed: int = 1,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = optimal_bands(threshold=threshold, num_perm=num_perm)
+        generator = np.random.default_rng(seed)
+        self._a = generator.integers(1, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._b = generator.integers(0, MERSENNE_PRIME, num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (
+                zlib.crc32(shingle.encode()) & MERSENNE_PRIME
+                for shingle in shingles(text, size=self.shingle_size)
+            ),
+            dtype=np.uint64,
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[band * self.rows : (band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+
+    def add(self, text: str) -> bool:
+        """Index `text` unless it near-duplicates an indexed text.
+
+        Returns True if `text` was a near duplicate (and was not indexed).
+        """
+        signature = self.signature(text)
+        keys = self._band_keys(signature)
+        candidates = {
+            index
+            for bucket, key in zip(self._buckets, keys)
+            for index in bucket.get(key, ())
+        }
+        if candidates:
+            indices = np.fromiter(candidates, dtype=np.int64)
+            matrix = np.stack([self._signatures[i] for i in indices])
+            similarity = (matrix == signature).mean(axis=1)
+            if similarity.max() >= self.threshold:
+                return True
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(index)
+        return False
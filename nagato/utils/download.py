@@ -0,0 +1,73 @@
+import hashlib
+from typing import BinaryIO, Callable
+
+import requests
+
+
+def download_to_file(
+    url: str,
+    file: BinaryIO,
+    block_size: int = 1024 * 1024,
+    max_retries: int = 3,
+    checksum: str = None,
+    callback: Callable[[int], None] = None,
+    timeout: float = 60,
+) -> str:
+    """Stream `url` into `file` and return the SHA-256 hex digest of the body.
+
+    Blocks are written straight to `file` as they arrive, so the download is
+    never held in memory. If the connection drops, the download resumes with
+    an HTTP Range request from the last written byte, up to `max_retries`
+    times. Servers that ignore the range restart from the beginning. When
+    `checksum` is given (`"sha256:<hex>"` or bare hex) the digest must match
+    it. `callback` receives the size of every written block.
+    """
+    start = file.tell()
+    written = 0
+    digest = hashlib.sha256()
+    total = None
+    attempt = 0
+    while True:
+        headers = {"Range": f"bytes={written}-"} if written else {}
+        try:
+            with requests.get(
+                url, stream=True, headers=headers, timeout=timeout
+            ) as response:
+                response.raise_for_status()
+                if written and response.status_code != 206:
+                    # Range not supported: start over
+                    file.seek(start)
+                    file.truncate()
+                    written = 0
+                    digest = hashlib.sha256()
+                if total is None and response.status_code == 200:
+                    length = response.headers.get("content-length")
+                    total = int(length) if length else None
+                for block in response.iter_content(block_size):
+                    file.write(block)
+                    digest.update(block)
+                    written += len(block)
+                    if callback:
+                        callback(len(block))
+            if total is not None and written < total:
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Download ended after {written} of {total} bytes"
+                )
+            break
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.Timeout,
+        ):
+            attempt += 1
+            if attempt > max_retries:
+                raise
+    file.flush()
+    hexdigest = digest.hexdigest()
+    if checksum:
+        expected = checksum.split(":", 1)[-1].lower()
+        if expected != hexdigest:
+            raise ValueError(
+                f"Checksum mismatch for {url}: expected {expected}, got {hexdigest}"
+            )
+    return hexdigest
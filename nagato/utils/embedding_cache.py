@@ -0,0 +1,101 @@
+import hashlib
+import unicodedata
+from typing import List
+
+import numpy as np
+from decouple import config
+from numpy import ndarray
+
+from nagato.utils.sqlite_cache import SQLiteStore, TieredCache
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFKC with collapsed whitespace."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+class EmbeddingStore(SQLiteStore):
+    """Persistent vector store backed by a single SQLite file.
+
+    Vectors are stored as raw `dtype` blobs keyed by string; float16 halves
+    the size at a small precision cost. Vectors are always returned as
+    float32.
+    """
+
+    def __init__(self, path: str, max_entries: int = 0, dtype: str = "float32"):
+        super().__init__(path=path, table="embeddings", max_entries=max_entries)
+        self.dtype = np.dtype(dtype)
+
+    def encode(self, value: ndarray) -> bytes:
+        return np.asarray(value, dtype=self.dtype).tobytes()
+
+    def decode(self, blob: bytes) -> ndarray:
+        return np.frombuffer(blob, dtype=self.dtype).astype(np.float32)
+
+
+class EmbeddingCache(TieredCache):
+    """Two-tier cache of text embeddings keyed by (model, normalized text).
+
+    The first tier is an in-memory LRU of `max_size` vectors. The optional
+    second tier is an `EmbeddingStore` on disk, so vectors survive restarts.
+    """
+
+    def __init__(self, max_size: int = 1024, store: EmbeddingStore = None):
+        super().__init__(max_size=max_size, store=store)
+
+    def get_many(self, model: str, texts: List[str]) -> List[ndarray]:
+        """Cached vectors for `texts`, with `None` in place of misses."""
+        keys = [embedding_key(model=model, text=text) for text in texts]
+        found = self.get_entries(keys)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, model: str, texts: List[str], vectors: List[ndarray]) -> None:
+        self.put_entries(
+            {
+                embedding_key(model=model, text=text): np.asarray(
+                    vector, dtype=np.float32
+                )
+                for text, vector in zip(texts, vectors)
+            }
+        )
+
+
+def _query_embedding_store():
+    path = config("NAGATO_QUERY_CACHE_PATH", default="")
+    if not path:
+        return None
+    return EmbeddingStore(
+        path=path,
+        max_entries=config("NAGATO_QUERY_CACHE_DISK_ENTRIES", default=100000, cast=int),
+    )
+
+
+query_embedding_cache = EmbeddingCache(
+    max_size=config("NAGATO_QUERY_CACHE_SIZE", default=1024, cast=int),
+    store=_query_embedding_store(),
+)
+
+
+def _chunk_embedding_cache():
+    path = config("NAGATO_EMBEDDING_CACHE_PATH", default="")
+    if not path:
+        return None
+    return EmbeddingCache(
+        max_size=config("NAGATO_EMBEDDING_CACHE_MEMORY_SIZE", default=0, cast=int),
+        store=EmbeddingStore(
+            path=path,
+            max_entries=config(
+                "NAGATO_EMBEDDING_CACHE_MAX_ENTRIES", default=0, cast=int
+            ),
+            dtype=config("NAGATO_EMBEDDING_CACHE_DTYPE", default="float32"),
+        ),
+    )
+
+
+# Shared by every ingestion run, filter_id and process pointed at the same
+# NAGATO_EMBEDDING_CACHE_PATH; disabled when the path is unset.
+chunk_embedding_cache = _chunk_embedding_cache()
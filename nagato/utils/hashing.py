@@ -0,0 +1,15 @@
+import hashlib
+
+
+def sha256_file(path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source_key: str, text: str) -> str:
+    """Content-addressed id of a chunk: the same text from the same source
+    always maps to the same vector id, so re-ingestion overwrites it."""
+    return hashlib.sha256(f"{source_key}\0{text}".encode()).hexdigest()
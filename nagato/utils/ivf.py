@@ -0,0 +1,145 @@
+import json
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from numpy import ndarray
+
+
+def spherical_kmeans(
+    vectors: ndarray, num_clusters: int, iterations: int = 15, seed: int = 0
+) -> ndarray:
+    """Cluster L2-normalized `vectors` by cosine similarity.
+
+    Returns a (num_clusters, dim) matrix of normalized centroids. Empty
+    clusters are re-seeded with the points that fit their centroid worst.
+    """
+    rng = np.random.default_rng(seed)
+    num_clusters = min(num_clusters, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        scores = vectors @ centroids.T
+        assignments = scores.argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=num_clusters)
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            worst = np.argsort(scores[np.arange(len(vectors)), assignments])
+            sums[empty] = vectors[worst[: len(empty)]]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.maximum(norms, np.finfo(np.float32).tiny)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """Inverted-file ANN index over the rows of a vector matrix.
+
+    Rows are partitioned into `nlist` clusters by spherical k-means. A query
+    only scores the rows of its `nprobe` closest clusters, trading recall
+    for latency. The index stores centroids (`centroids.npy`) and one int32
+    list assignment per row (`assignments.i32`). New rows are assigned
+    incrementally and appended, so upserts never rewrite the whole index.
+    """
+
+    def __init__(self, path: str, nlist: int = 0, nprobe: int = 8):
+        self.path = path
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self._centroids_path = os.path.join(path, "centroids.npy")
+        self._assignments_path = os.path.join(path, "assignments.i32")
+        self._info_path = os.path.join(path, "ivf.json")
+        self.centroids = None
+        self.trained_rows = 0
+        self._assignments = np.empty(0, dtype=np.int32)
+        self._lists = None
+        self._load()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def size(self) -> int:
+        return len(self._assignments)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._info_path):
+            return
+        with open(self._info_path, "r") as f:
+            self.trained_rows = json.load(f)["trained_rows"]
+        self.centroids = np.load(self._centroids_path)
+        self._assignments = np.fromfile(self._assignments_path, dtype=np.int32)
+
+    def train(self, matrix: ndarray, sample_size: int = 256) -> None:
+        """(Re)build the clustering from every row of `matrix`."""
+        nlist = self.nlist or max(1, int(np.sqrt(len(matrix))))
+        rng = np.random.default_rng(0)
+        sample_rows = min(len(matrix), nlist * sample_size)
+        sample = np.asarray(
+            matrix[np.sort(rng.choice(len(matrix), sample_rows, replace=False))]
+        )
+        self.centroids = spherical_kmeans(sample, nlist)
+        self._assignments = self.assign(matrix)
+        self.trained_rows = len(matrix)
+        np.save(self._centroids_path, self.centroids)
+        self._assignments.tofile(self._assignments_path)
+        with open(self._info_path, "w") as f:
+            json.dump({"trained_rows": self.trained_rows}, f)
+        self._lists = None
+
+    def assign(self, matrix: ndarray, block_size: int = 65536) -> ndarray:
+        assignments = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), block_size):
+            block = np.asarray(matrix[start : start + block_size])
+            assignments[start : start + block_size] = (block @ self.centroids.T).argmax(
+                axis=1
+            )
+        return assignments
+
+    def add(self, rows: List[int], vectors: ndarray) -> None:
+        """Assign `vectors` (stored at `rows` of the matrix) to their lists."""
+        assignments = self.assign(vectors)
+        rows = np.asarray(rows)
+        existing = rows < len(self._assignments)
+        if existing.any():
+            self._assignments[rows[existing]] = assignments[existing]
+            with open(self._assignments_path, "r+b") as f:
+                for row, assignment in zip(rows[existing], assignments[existing]):
+                    f.seek(int(row) * 4)
+                    f.write(assignment.tobytes())
+        appended = assignments[~existing][np.argsort(rows[~existing])]
+        if len(appended):
+            self._assignments = np.concatenate([self._assignments, appended])
+            with open(self._assignments_path, "ab") as f:
+                f.write(appended.tobytes())
+        self._lists = None
+
+    def _build_lists(self) -> Tuple[ndarray, ndarray]:
+        order = np.argsort(self._assignments, kind="stable")
+        counts = np.bincount(self._assignments, minlength=len(self.centroids))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return order, offsets
+
+    def lists(self) -> Optional[Tuple[ndarray, ndarray, ndarray]]:
+        """`(centroids, order, offsets)` of the current clustering, or None
+        while untrained. Take it under the same lock as `train` and `add`
+        and pass it to `candidates`, so a query never mixes two clusterings.
+        """
+        if self.centroids is None:
+            return None
+        if self._lists is None:
+            self._lists = self._build_lists()
+        return (self.centroids,) + self._lists
+
+    def candidates(
+        self,
+        query: ndarray,
+        nprobe: int = None,
+        lists: Tuple[ndarray, ndarray, ndarray] = None,
+    ) -> ndarray:
+        """Rows in the `nprobe` lists whose centroids are closest to `query`."""
+        centroids, order, offsets = lists or self.lists()
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        probes = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([order[offsets[c] : offsets[c + 1]] for c in probes])
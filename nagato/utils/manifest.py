@@ -0,0 +1,80 @@
+import json
+import os
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from decouple import config
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are merged but not locked
+    fcntl = None
+
+
+def manifest_enabled(incremental: bool = False) -> bool:
+    """Manifests are only read and written for incremental ingestion or when
+    NAGATO_MANIFEST_PATH is set, so default ingestion never touches disk."""
+    return incremental or bool(config("NAGATO_MANIFEST_PATH", default=""))
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive advisory lock on `path` across processes."""
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class IngestionManifest:
+    """Per-(provider, index, `filter_id`) record of ingested documents and
+    their chunk ids.
+
+    Stored as `<NAGATO_MANIFEST_PATH>/<provider>/<index_name>/<filter_id>.json`,
+    mapping each source key to the SHA-256 of its content and the ids of the
+    chunks upserted for it. Incremental ingestion diffs against it to find
+    new and stale chunks. `save` re-reads the file under a lock and merges
+    in only the entries set since loading, so concurrent ingestions into the
+    same namespace keep each other's entries.
+    """
+
+    def __init__(self, filter_id: str, index_name: str, provider: str = "PINECONE"):
+        self.filter_id = filter_id
+        directory = os.path.join(
+            config("NAGATO_MANIFEST_PATH", default=".nagato/manifests"),
+            provider,
+            index_name,
+        )
+        self.path = os.path.join(directory, f"{filter_id or '__default__'}.json")
+        self.documents: Dict[str, Dict] = self._read()
+        self._changes: Dict[str, Dict] = {}
+
+    def _read(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)["documents"]
+
+    def get(self, source_key: str) -> Optional[Dict]:
+        return self.documents.get(source_key)
+
+    def set(self, source_key: str, content_hash: str, chunk_ids: List[str]) -> None:
+        entry = {"hash": content_hash, "chunks": chunk_ids}
+        self.documents[source_key] = entry
+        self._changes[source_key] = entry
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with file_lock(f"{self.path}.lock"):
+            documents = self._read()
+            documents.update(self._changes)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"documents": documents}, f)
+            os.replace(temp_path, self.path)
+        self.documents = documents
+        self._changes = {}
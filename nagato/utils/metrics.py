@@ -0,0 +1,192 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Tuple
+
+from decouple import config
+
+# Upper bounds in seconds, from a cached query embedding up to a long
+# download or completion
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    float("inf"),
+)
+
+Hook = Callable[[str, float, int], None]
+
+_NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    """Cumulative latency histogram with fixed buckets.
+
+    Also counts `items`, the number of units (documents, chunks, vectors,
+    ...) processed by all observations, for throughput.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.items = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float, items: int = 1) -> None:
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.items += items
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate the `q` quantile by interpolating within its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-2]
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "items": self.items,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "items_per_second": self.items / self.sum if self.sum else 0.0,
+        }
+
+
+class MetricsRegistry:
+    """Per-stage latency and throughput of the nagato pipeline.
+
+    Stages report through `timer` (a context manager) or `observe`. Each
+    observation goes into the stage's `Histogram` and to every registered
+    hook as `hook(stage, seconds, items)`. While the registry is disabled
+    `timer` returns a shared no-op context manager, so instrumented code
+    pays only for one attribute check. Adding a hook enables the registry.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._histograms: Dict[str, Histogram] = {}
+        self._hooks: List[Hook] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: Hook) -> None:
+        with self._lock:
+            self._hooks.append(hook)
+        self.enabled = True
+
+    def remove_hook(self, hook: Hook) -> None:
+        with self._lock:
+            self._hooks.remove(hook)
+
+    def observe(self, stage: str, seconds: float, items: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds, items=items)
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook(stage, seconds, items)
+
+    def timer(self, stage: str, items: int = 1):
+        """Time the enclosed block as one observation of `stage`."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return self._timer(stage, items)
+
+    @contextmanager
+    def _timer(self, stage: str, items: int):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, items=items)
+
+    def wrap(self, stage: str, fn: Callable, items: int = 1) -> Callable:
+        """`fn`, timed as `stage` on every call (or `fn` itself if disabled)."""
+        if not self.enabled:
+            return fn
+
+        def timed(*args, **kwargs):
+            with self._timer(stage, items):
+                return fn(*args, **kwargs)
+
+        return timed
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                stage: histogram.snapshot()
+                for stage, histogram in sorted(self._histograms.items())
+            }
+
+    def render_prometheus(self, prefix: str = "nagato") -> str:
+        """All histograms in the Prometheus text exposition format."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds Latency of nagato pipeline stages.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            for stage, histogram in histograms:
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(
+                        f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} '
+                        f"{cumulative}"
+                    )
+                lines.append(
+                    f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}'
+                )
+                lines.append(
+                    f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram.count}'
+                )
+            lines.append(
+                f"# HELP {prefix}_stage_items_total Units processed by each stage."
+            )
+            lines.append(f"# TYPE {prefix}_stage_items_total counter")
+            for stage, histogram in histograms:
+                lines.append(
+                    f'{prefix}_stage_items_total{{stage="{stage}"}} {histogram.items}'
+                )
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+# Stages: download, parse, chunk, encode, upsert, query, rerank, completion
+# and first_token. Enable with NAGATO_METRICS=true or by adding a hook.
+metrics = MetricsRegistry(enabled=config("NAGATO_METRICS", default=False, cast=bool))
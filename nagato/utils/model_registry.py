@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Tuple
+
+from decouple import config
+
+
+def load_sentence_transformer(model_name: str):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(
+        model_name_or_path=model_name, use_auth_token=config("HF_API_KEY")
+    )
+
+
+def estimate_model_size(model: Any) -> int:
+    """Best-effort size of a torch model's parameters and buffers in bytes."""
+    # Wrappers such as sentence_transformers.CrossEncoder keep the torch
+    # module on `.model`
+    if not hasattr(model, "parameters"):
+        model = getattr(model, "model", model)
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+    except AttributeError:
+        return 0
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded models keyed by (loader, model name).
+
+    Concurrent requests for the same model are single-flight: only one thread
+    loads the weights while the others wait for it. Models are kept in LRU
+    order and the least recently used ones are evicted once the summed size
+    exceeds `memory_budget` bytes (0 disables eviction). The most recently
+    requested model is never evicted, even if it alone exceeds the budget.
+    """
+
+    def __init__(self, memory_budget: int = 0):
+        self.memory_budget = memory_budget
+        self._models: "OrderedDict[Tuple[Callable, str], Tuple[Any, int]]" = (
+            OrderedDict()
+        )
+        self._load_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self, model_name: str, loader: Callable[[str], Any] = load_sentence_transformer
+    ) -> Any:
+        key = (loader, model_name)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key][0]
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    return self._models[key][0]
+            model = loader(model_name)
+            self.register(model_name=model_name, model=model, loader=loader)
+            return model
+
+    def register(
+        self,
+        model_name: str,
+        model: Any,
+        loader: Callable[[str], Any] = load_sentence_transformer,
+    ) -> None:
+        """Make an already constructed `model` resident under `model_name`."""
+        key = (loader, model_name)
+        with self._lock:
+            self._models[key] = (model, estimate_model_size(model))
+            self._models.move_to_end(key)
+            self._evict()
+
+    def warmup(
+        self,
+        model_names: Iterable[str],
+        loader: Callable[[str], Any] = load_sentence_transformer,
+    ) -> None:
+        for model_name in model_names:
+            self.get(model_name=model_name, loader=loader)
+
+    def evict(
+        self, model_name: str, loader: Callable[[str], Any] = load_sentence_transformer
+    ) -> None:
+        with self._lock:
+            self._models.pop((loader, model_name), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    @property
+    def resident_size(self) -> int:
+        with self._lock:
+            return sum(size for _, size in self._models.values())
+
+    def __contains__(self, model_name: str) -> bool:
+        with self._lock:
+            return any(name == model_name for _, name in self._models)
+
+    def _evict(self) -> None:
+        if not self.memory_budget:
+            return
+        total = sum(size for _, size in self._models.values())
+        while total > self.memory_budget and len(self._models) > 1:
+            _, (_, size) = self._models.popitem(last=False)
+            total -= size
+
+
+model_registry = ModelRegistry(
+    memory_budget=config("NAGATO_MODEL_MEMORY_BUDGET_MB", default=0, cast=int)
+    * 1024
+    * 1024
+)
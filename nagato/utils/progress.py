@@ -0,0 +1,90 @@
+import threading
+from typing import Callable, Dict
+
+from decouple import config
+
+ProgressCallback = Callable[[Dict], None]
+
+_callback_lock = threading.Lock()
+_callback: ProgressCallback = None
+
+
+def set_progress_callback(callback: ProgressCallback = None) -> None:
+    """Send progress to `callback` instead of tqdm bars (None restores tqdm).
+
+    The callback receives dicts with `desc`, `n`, `total`, `done` and any
+    postfix fields, on every update of every progress bar.
+    """
+    global _callback
+    with _callback_lock:
+        _callback = callback
+
+
+class CallbackProgress:
+    """tqdm lookalike that reports to a callback, or nowhere when quiet."""
+
+    def __init__(
+        self,
+        callback: ProgressCallback = None,
+        total: int = None,
+        initial: int = 0,
+        desc: str = None,
+    ):
+        self.callback = callback
+        self.total = total
+        self.n = initial
+        self.desc = desc
+        self.postfix = {}
+        self.done = False
+
+    def _emit(self) -> None:
+        if self.callback is not None:
+            self.callback(
+                {
+                    "desc": self.desc,
+                    "n": self.n,
+                    "total": self.total,
+                    "done": self.done,
+                    **self.postfix,
+                }
+            )
+
+    def update(self, n: int = 1) -> None:
+        self.n += n
+        self._emit()
+
+    def set_description(self, desc: str) -> None:
+        self.desc = desc
+        self._emit()
+
+    def set_postfix(self, **postfix) -> None:
+        self.postfix = postfix
+
+    def close(self) -> None:
+        if not self.done:
+            self.done = True
+            self._emit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+        return False
+
+
+def progress(total: int = None, desc: str = None, initial: int = 0, **kwargs):
+    """A progress bar for library code.
+
+    Returns a tqdm bar by default. With a callback set through
+    `set_progress_callback` progress goes to the callback instead, and with
+    NAGATO_QUIET=true it is dropped; neither imports tqdm.
+    """
+    callback = _callback
+    if callback is not None or config("NAGATO_QUIET", default=False, cast=bool):
+        return CallbackProgress(
+            callback=callback, total=total, initial=initial, desc=desc
+        )
+    from tqdm import tqdm
+
+    return tqdm(total=total, desc=desc, initial=initial, **kwargs)
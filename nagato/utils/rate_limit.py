@@ -0,0 +1,77 @@
+import random
+import threading
+import time
+from typing import Callable
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "RateLimitError",
+    "Timeout",
+    "APITimeoutError",
+    "APIConnectionError",
+    "ServiceUnavailableError",
+    "TryAgain",
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate_per_minute`.
+
+    `acquire` blocks until `amount` tokens are available. Requests larger
+    than the bucket's capacity are let through once the bucket is full, so
+    they can't block forever.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> None:
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    return status in RETRYABLE_STATUS_CODES or type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_after(error: Exception) -> float:
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def retry_with_backoff(
+    fn: Callable,
+    max_retries: int = 6,
+    base_delay: float = 1,
+    max_delay: float = 60,
+    retryable: Callable[[Exception], bool] = is_retryable,
+):
+    """Call `fn`, retrying retryable errors with full-jitter exponential
+    backoff (and at least any `Retry-After` the server asked for)."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except Exception as error:
+            if attempt == max_retries or not retryable(error):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            time.sleep(max(delay, retry_after(error)))
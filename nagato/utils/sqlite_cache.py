@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+class SQLiteStore:
+    """Persistent key-value store backed by a table in one SQLite file.
+
+    Subclasses define how values are stored by overriding `encode` and
+    `decode`. Entries older than `ttl` seconds (0 keeps them forever) are
+    treated as missing and purged on write, and when `max_entries` is set the
+    least recently read entries are evicted on write. SQLite's file locking
+    makes the store safe to share between processes.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int = 0, ttl: float = 0):
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)"
+        )
+        self._connection.commit()
+
+    def encode(self, value: Any) -> bytes:
+        return value
+
+    def decode(self, blob: bytes) -> Any:
+        return blob
+
+    def get_many(
+        self, keys: Iterable[str], chunk_size: int = 500
+    ) -> Dict[str, Tuple[float, Any]]:
+        """`(created, value)` of every key in `keys` that is stored and live."""
+        keys = list(keys)
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start : start + chunk_size]
+                rows = self._connection.execute(
+                    f"SELECT key, value, created FROM {self.table} "
+                    f"WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                rows = [row for row in rows if not self.ttl or now - row[2] <= self.ttl]
+                for key, blob, created in rows:
+                    found[key] = (created, self.decode(blob))
+                self._touch(keys=[row[0] for row in rows], now=now)
+            self._connection.commit()
+        return found
+
+    def scan(self, prefix: str) -> Dict[str, Tuple[float, Any]]:
+        """`(created, value)` of every live key starting with `prefix`, without
+        marking them as read."""
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT key, value, created FROM {self.table} "
+                "WHERE key >= ? AND key < ?",
+                (prefix, prefix + "\uffff"),
+            ).fetchall()
+        now = time.time()
+        return {
+            key: (created, self.decode(blob))
+            for key, blob, created in rows
+            if not self.ttl or now - created <= self.ttl
+        }
+
+    def touch(self, keys: List[str]) -> None:
+        """Mark `keys` as read, so eviction keeps them longer."""
+        with self._lock:
+            self._touch(keys=keys, now=time.time())
+            self._connection.commit()
+
+    def _touch(self, keys: List[str], now: float) -> None:
+        if keys:
+            self._connection.execute(
+                f"UPDATE {self.table} SET accessed = ? "
+                f"WHERE key IN ({','.join('?' * len(keys))})",
+                [now, *keys],
+            )
+
+    def put_many(self, items: Dict[str, Any], created: float = None) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (key, self.encode(value), created or now, now)
+                    for key, value in items.items()
+                ],
+            )
+            if self.ttl:
+                self._connection.execute(
+                    f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,)
+                )
+            if self.max_entries:
+                self._connection.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY accessed DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._connection.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._connection.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM {self.table}"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute(f"DELETE FROM {self.table}")
+            self._connection.commit()
+
+
+class TieredCache:
+    """Two-tier cache: an in-memory LRU of `max_size` entries in front of an
+    optional `SQLiteStore`. Entries expire `ttl` seconds after they were
+    created (0 keeps them forever); entries read from disk are promoted into
+    memory.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 0, store=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entries(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """The cached value of every key in `keys` that is present."""
+        keys = list(keys)
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None and self.ttl and now - entry[0] > self.ttl:
+                    del self._memory[key]
+                    entry = None
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = entry[1]
+        missing = [key for key in keys if key not in found]
+        stored = self.store.get_many(missing) if self.store and missing else {}
+        with self._lock:
+            for key in keys:
+                if key in found:
+                    self.hits += 1
+                elif key in stored:
+                    found[key] = stored[key][1]
+                    self._remember(key, stored[key])
+                    self.hits += 1
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+        return found
+
+    def put_entries(self, items: Dict[str, Any]) -> None:
+        created = time.time()
+        with self._lock:
+            for key, value in items.items():
+                self._remember(key, (created, value))
+        if self.store:
+            self.store.put_many(items, created=created)
+
+    def _remember(self, key: str, entry: Tuple[float, Any]) -> None:
+        if self.max_size <= 0:
+            return
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._memory),
+            }
+        if self.store:
+            stats.update({f"disk_{k}": v for k, v in self.store.stats().items()})
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.disk_hits = self.misses = 0
+        if self.store:
+            self.store.clear()
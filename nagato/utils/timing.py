@@ -0,0 +1,30 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class StageTimer:
+    """Collects a wall-clock latency breakdown of a request, in seconds.
+
+    `stage` times a block; `mark` records the time elapsed since the timer
+    was created (e.g. time-to-first-token).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - started
+
+    def mark(self, name: str) -> None:
+        self.timings.setdefault(name, time.perf_counter() - self.started)
+
+    def total(self) -> Dict[str, float]:
+        self.timings["total"] = time.perf_counter() - self.started
+        return self.timings
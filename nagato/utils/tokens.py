@@ -0,0 +1,60 @@
+from functools import lru_cache
+
+from decouple import config
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = None):
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model)
+    except (KeyError, TypeError):
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+# Context window sizes in tokens, matched by longest model-name prefix
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-1106-preview": 128000,
+    "claude-2": 100000,
+    "claude-instant-1": 100000,
+    "command-nightly": 4096,
+    "replicate/meta/llama-2": 4096,
+    "replicate/llama-2": 4096,
+}
+
+
+def get_context_window(model: str) -> int:
+    """Context window of `model`; NAGATO_CONTEXT_WINDOW overrides the table."""
+    override = config("NAGATO_CONTEXT_WINDOW", default=0, cast=int)
+    if override:
+        return override
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model.startswith(prefix)]
+    if not matches:
+        return 4096
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str = None) -> str:
+    """Cut `text` to at most `max_tokens`, backing off to the last sentence or
+    line break (or else word break) so it does not end mid-word."""
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    truncated = encoding.decode(tokens[:max_tokens])
+    boundary = max(truncated.rfind(". "), truncated.rfind("\n"))
+    if boundary < len(truncated) // 2:
+        boundary = truncated.rfind(" ")
+    return truncated[: boundary + 1].rstrip() if boundary > 0 else truncated
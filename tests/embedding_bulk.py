@@ -0,0 +1,26 @@
+from nagato.service import create_vector_embeddings_bulk
+
+
+def main():
+    result = create_vector_embeddings_bulk(
+        sources=[
+            {
+                "type": "PDF",
+                "url": "https://digitalassets.tesla.com/tesla-contents/image/upload/IR/TSLA-Q2-2023-Update.pdf",
+                "filter_id": "011",
+            },
+            {
+                "type": "PDF",
+                "url": "https://digitalassets.tesla.com/tesla-contents/image/upload/IR/TSLA-Q3-2023-Update-3.pdf",
+                "filter_id": "012",
+            },
+        ],
+        model="all-MiniLM-L6-v2",
+    )
+    print(result)
+
+
+# create_vector_embeddings_bulk parses in worker processes, which re-import
+# this module under the spawn and forkserver start methods
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from pinecone.core.client.model.scored_vector import ScoredVector
+
+from nagato.service import query_documents
+from nagato.service.lexical import reciprocal_rank_fusion
+
+
+def main():
+    vector_matches = [
+        ScoredVector(id="a", score=0.9, values=[], metadata={"content": "Q2 revenue"}),
+        ScoredVector(id="b", score=0.8, values=[], metadata={"content": "Q1 revenue"}),
+    ]
+    lexical_matches = [{"id": "b", "score": 7.1, "metadata": {"content": "Q1 revenue"}}]
+    fused = reciprocal_rank_fusion(results=[vector_matches, lexical_matches], top_k=2)
+    assert [match["id"] for match in fused] == ["b", "a"]
+    assert all(isinstance(match, dict) for match in fused)
+    print(fused)
+
+    result = query_documents(
+        query="What was total revenues in Q2 2023?",
+        filter_id="011",
+        model="huggingface/sentence-transformers/all-MiniLM-L6-v2",
+        hybrid=True,
+    )
+    print(result)
+
+
+main()
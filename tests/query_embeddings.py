@@ -0,0 +1,18 @@
+from nagato.service import query_embeddings
+
+
+def main():
+    results = query_embeddings(
+        queries=[
+            "What was total revenues in Q2 2023?",
+            "What was the gross margin in Q2 2023?",
+            "How many vehicles were delivered in Q2 2023?",
+        ],
+        filter_id="011",
+        model="huggingface/sentence-transformers/all-MiniLM-L6-v2",
+    )
+    for result in results:
+        print(result)
+
+
+main()